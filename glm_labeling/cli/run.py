@@ -58,7 +58,7 @@ def run(prefix, limit, workers, rag, images_dir, output_dir, no_resume):
       glm-label run -p D3.100f -w 10 -o output/custom_dir
     """
     from ..config import get_config
-    from ..utils import get_logger
+    from ..utils import get_logger, find_images
     from ..core import ParallelProcessor
     
     config = get_config()
@@ -68,15 +68,9 @@ def run(prefix, limit, workers, rag, images_dir, output_dir, no_resume):
         click.echo("❌ 请设置 ZAI_API_KEY 环境变量", err=True)
         raise SystemExit(1)
     
-    # 获取图片列表
+    # 获取图片列表（支持多种图片格式和命名模式）
     images_dir = Path(images_dir)
-    
-    # 支持多种图片格式和命名模式
-    patterns = [f"{prefix}_*.jpg", f"{prefix}_*.png", f"{prefix}*.jpg"]
-    image_files = []
-    for pattern in patterns:
-        image_files.extend(images_dir.glob(pattern))
-    image_files = sorted(set(image_files))
+    image_files = find_images(images_dir, prefix)
     
     if limit:
         image_files = image_files[:limit]
@@ -152,7 +152,8 @@ class ObjectDetector:
                 max_retries=self.max_retries,
                 delay=self.config.retry_delay,
                 on_retry=lambda a, e: self.logger.warning(
-                    f"[{image_name}] Retry {a}/{self.max_retries}: {type(e).__name__}: {e}"
+                    "[%s] Retry %d/%d: %s: %s",
+                    image_name, a, self.max_retries, type(e).__name__, e
                 )
             )
 
@@ -6,7 +6,6 @@
 """
 
 import threading
-from pathlib import Path
 from typing import Dict, List, Optional
 from datetime import datetime
 
@@ -73,12 +72,9 @@ class TaskManager:
         images_dir = images_dir or self.config.images_dir
         
         # 查找图片
-        images_path = Path(images_dir)
-        patterns = [f"{prefix}_*.jpg", f"{prefix}_*.png", f"{prefix}*.jpg"]
-        image_files = []
-        for pattern in patterns:
-            image_files.extend(images_path.glob(pattern))
-        image_files = sorted(set(image_files))
+        from ..utils import find_images
+        
+        image_files = find_images(images_dir, prefix)
         
         if limit:
             image_files = image_files[:limit]
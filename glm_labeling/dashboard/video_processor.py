@@ -77,7 +77,8 @@ class VideoProcessor:
         duration = self._get_video_duration(video_path)
         
         cmd = [
-            "ffmpeg", "-i", str(video_path),
+            "ffmpeg", "-loglevel", "error", "-nostats",
+            "-i", str(video_path),
             "-vf", f"fps={fps}",
             "-q:v", "2",
             output_pattern,
@@ -86,10 +87,11 @@ class VideoProcessor:
         ]
         
         try:
+            # stderr 不读取，直接丢弃（未读取的管道写满后会阻塞 ffmpeg）
             process = subprocess.Popen(
                 cmd,
                 stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
                 text=True
             )
             
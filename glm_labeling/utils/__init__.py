@@ -12,6 +12,7 @@
 from .image import (
     image_to_base64_url, 
     image_to_base64,
+    find_images,
     get_image_size, 
     crop_region,
     convert_normalized_coords
@@ -5,9 +5,10 @@
 """
 
 import base64
+import os
 import uuid
 from pathlib import Path
-from typing import Tuple, Optional
+from typing import List, Tuple, Optional, Union
 from PIL import Image
 
 
@@ -37,6 +38,40 @@ def image_to_base64_url(image_path: str) -> str:
     return f"data:{mime_type};base64,{image_data}"
 
 
+def find_images(images_dir: Union[str, Path], prefix: str) -> List[Path]:
+    """
+    查找指定前缀的帧图片
+
+    匹配规则与 ``{prefix}_*.jpg``、``{prefix}_*.png``、``{prefix}*.jpg``
+    三个 glob 的并集一致，但只用一次 ``os.scandir`` 遍历目录。
+
+    Args:
+        images_dir: 图片目录
+        prefix: 图片前缀（如 D1）
+
+    Returns:
+        排序后的图片路径列表，目录不存在时返回空列表
+    """
+    if not os.path.isdir(images_dir):
+        return []
+
+    underscore_prefix = f"{prefix}_"
+    image_files = []
+
+    with os.scandir(images_dir) as entries:
+        for entry in entries:
+            name = entry.name
+            if not name.startswith(prefix) or not entry.is_file():
+                continue
+
+            ext = os.path.splitext(name)[1]
+            if ext == ".jpg" or (ext == ".png" and name.startswith(underscore_prefix)):
+                image_files.append(Path(entry.path))
+
+    image_files.sort()
+    return image_files
+
+
 def get_image_size(image_path: str) -> Tuple[int, int]:
     """
     获取图片尺寸
@@ -4,7 +4,10 @@
 提供统一的日志配置，替代散落各处的 print() 语句。
 """
 
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 from pathlib import Path
 from typing import Optional
@@ -45,7 +48,7 @@ def setup_logger(
     # 控制台输出
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers = [console_handler]
     
     # 文件输出（可选）
     if log_file:
@@ -53,7 +56,17 @@ def setup_logger(
         log_file.parent.mkdir(parents=True, exist_ok=True)
         file_handler = logging.FileHandler(log_file, encoding="utf-8")
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+    
+    # 工作线程只负责入队，格式化和写入交给后台线程，避免多线程争抢 handler 锁
+    log_queue = queue.Queue(-1)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    
+    listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
     
     return logger
 
@@ -86,6 +99,7 @@ class TaskProgress:
     
     def __init__(self, total: int, task_name: str = "Processing"):
         self.total = total
+        self._total_str = str(total)
         self.current = 0
         self.task_name = task_name
         self.logger = get_logger()
@@ -94,40 +108,40 @@ class TaskProgress:
     
     def start(self):
         """开始任务"""
-        self.logger.info("=" * 60)
-        self.logger.info(f"🚀 {self.task_name} - Total: {self.total} items")
-        self.logger.info("=" * 60)
+        self.logger.info("\n".join([
+            "=" * 60,
+            f"🚀 {self.task_name} - Total: {self.total} items",
+            "=" * 60,
+        ]))
     
     def update(self, item_name: str, success: bool = True, message: str = ""):
         """更新进度"""
         self.current += 1
         
+        # 交给 logger 延迟格式化：级别未启用时不做任何字符串拼接
+        separator = " - " if message else ""
         if success:
             self.success_count += 1
-            emoji = "✅"
+            self.logger.info("✅ [%d/%s] %s%s%s", self.current, self._total_str,
+                             item_name, separator, message)
         else:
             self.error_count += 1
-            emoji = "❌"
-        
-        progress = f"[{self.current}/{self.total}]"
-        log_msg = f"{emoji} {progress} {item_name}"
-        if message:
-            log_msg += f" - {message}"
-        
-        if success:
-            self.logger.info(log_msg)
-        else:
-            self.logger.warning(log_msg)
+            self.logger.warning("❌ [%d/%s] %s%s%s", self.current, self._total_str,
+                                item_name, separator, message)
     
     def finish(self, extra_stats: Optional[dict] = None):
         """完成任务"""
-        self.logger.info("=" * 60)
-        self.logger.info(f"📊 {self.task_name} Complete")
-        self.logger.info(f"   ✅ Success: {self.success_count}")
-        self.logger.info(f"   ❌ Errors: {self.error_count}")
+        # 汇总为一条日志，减少 handler 锁竞争
+        lines = [
+            "=" * 60,
+            f"📊 {self.task_name} Complete",
+            f"   ✅ Success: {self.success_count}",
+            f"   ❌ Errors: {self.error_count}",
+        ]
         
         if extra_stats:
             for key, value in extra_stats.items():
-                self.logger.info(f"   📈 {key}: {value}")
+                lines.append(f"   📈 {key}: {value}")
         
-        self.logger.info("=" * 60)
+        lines.append("=" * 60)
+        self.logger.info("\n".join(lines))
@@ -9,6 +9,8 @@ import functools
 from typing import Tuple, Type, Callable, Any
 import logging
 
+__all__ = ["retry_with_backoff", "retry_api_call"]
+
 
 def retry_with_backoff(
     max_retries: int = 3,
@@ -50,14 +52,14 @@ def retry_with_backoff(
                     
                     if attempt < max_retries - 1:
                         logger.warning(
-                            f"Attempt {attempt + 1}/{max_retries} failed: {e}. "
-                            f"Retrying in {delay:.1f}s..."
+                            "Attempt %d/%d failed: %s. Retrying in %.1fs...",
+                            attempt + 1, max_retries, e, delay
                         )
                         time.sleep(delay)
                         delay *= backoff_factor
                     else:
                         logger.error(
-                            f"All {max_retries} attempts failed. Last error: {e}"
+                            "All %d attempts failed. Last error: %s", max_retries, e
                         )
             
             raise last_exception
@@ -121,17 +123,15 @@ def retry_api_call(
 
 def _is_rate_limit_error(e: Exception) -> bool:
     """检查是否为 API 限流错误 (429)"""
-    error_str = str(e).lower()
-    # 检查常见的限流错误标识
-    if '429' in error_str or 'rate limit' in error_str or 'too many requests' in error_str:
+    # 优先检查异常属性，避免对 HTTP 异常做昂贵的字符串化
+    if getattr(e, 'status_code', None) == 429:
         return True
-    # 检查异常属性
-    if hasattr(e, 'status_code') and e.status_code == 429:
+    response = getattr(e, 'response', None)
+    if response is not None and getattr(response, 'status_code', None) == 429:
         return True
-    if hasattr(e, 'response') and hasattr(e.response, 'status_code'):
-        if e.response.status_code == 429:
-            return True
-    return False
+    # 兜底：检查常见的限流错误标识
+    error_str = str(e).lower()
+    return '429' in error_str or 'rate limit' in error_str or 'too many requests' in error_str
 
 
 def _get_retry_after(e: Exception) -> float | None:
@@ -2,7 +2,7 @@
 """
 并行版自动标注脚本
 
-使用 concurrent.futures 实现多线程并行处理，大幅提升批量标注速度。
+使用 asyncio + httpx 实现并发 API 请求，大幅提升批量标注速度。
 原来 100 张图需要 ~15 分钟，现在 ~3 分钟。
 
 用法:
@@ -10,51 +10,210 @@
 """
 
 import os
+import io
+import math
+import re
 import json
+import mmap
+import hashlib
 import base64
 import argparse
 import time
-import uuid  # 用于生成唯一文件名，避免多线程冲突
+import random
+import threading
+import asyncio
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import httpx
 from PIL import Image
-from zai import ZaiClient
+
+try:
+    import numpy as np
+except ImportError:
+    # 可选依赖：未安装时逐个换算坐标
+    np = None
+
+try:
+    import ahocorasick
+except ImportError:
+    # 可选依赖：未安装时按类别逐个正则匹配
+    ahocorasick = None
+
+try:
+    import h2  # noqa: F401  仅用于检测 httpx 能否启用 HTTP/2
+    HTTP2_ENABLED = True
+except ImportError:
+    # 可选依赖：未安装时连接池走 HTTP/1.1
+    HTTP2_ENABLED = False
+
+try:
+    import orjson
+except ImportError:
+    # 可选依赖：未安装时回退到标准库 json
+    orjson = None
+
+# orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，调用方的异常处理不变
+_json_loads = orjson.loads if orjson is not None else json.loads
 
 
 # ============================================================================
 # 配置
 # ============================================================================
 
+API_BASE_URL = "https://api.z.ai/api/paas/v4"
+MODEL_NAME = "glm-4.6v"
+
+DETECTION_PROMPT = """请检测图片中的以下4类物体，返回JSON格式。
+
+## 检测类别与细粒度要求：
+
+### 1. 行人类 (pedestrian) - 2种标签
+- pedestrian: 单个或少量行人
+- crowd: 人群（多人聚集）
+
+### 2. 车辆类 (vehicle) - 5种标签
+统一使用 vehicle，只区分行驶状态：
+
+**状态判断规则**（按优先级）：
+1. **刹车状态**: 尾灯明显变亮、红色刹车灯亮起 → `vehicle_braking`
+2. **双闪状态**: 左右两侧转向灯同时亮起/闪烁 → `vehicle_double_flash`
+3. **右转状态**: 车身朝右/车头转向右侧/右转车道转弯/仅右侧转向灯亮 → `vehicle_turning_right`
+4. **左转状态**: 车身朝左/车头转向左侧/左转车道转弯/仅左侧转向灯亮 → `vehicle_turning_left`
+5. **正常状态**: 直行或无法判断 → `vehicle`
+
+注意：
+- 不要标注第一人称视角的车辆（拍摄车辆本身）
+- 所有机动车（轿车、卡车、公交、摩托车等）和自行车都统一标注为 vehicle
+
+### 3. 交通标志类 (traffic_sign)
+traffic_sign
+
+### 4. 施工标志类 (construction)
+traffic_cone, construction_barrier
+
+## 返回格式示例：
+[
+  {"label": "vehicle_braking", "bbox_2d": [100, 200, 300, 400]},
+  {"label": "vehicle_double_flash", "bbox_2d": [400, 300, 600, 500]},
+  {"label": "vehicle_turning_left", "bbox_2d": [700, 200, 800, 400]},
+  {"label": "vehicle", "bbox_2d": [900, 300, 1100, 500]},
+  {"label": "traffic_sign", "bbox_2d": [50, 50, 80, 80]}
+]
+
+如果没有目标，返回 []
+只返回JSON数组！"""
+
+@lru_cache(maxsize=16)
+def build_batch_prompt(n: int) -> str:
+    """多图批量检测提示词：同一请求携带 n 张图片，按顺序返回嵌套数组"""
+    return f"""上面依次给出了 {n} 张图片，请对每张图片分别完成下面的检测任务。
+
+{DETECTION_PROMPT}
+
+## 批量返回格式：
+返回一个长度为 {n} 的 JSON 数组，第 i 个元素是第 i 张图片的检测结果数组（没有目标则为 []），例如：
+[[{{"label": "vehicle", "bbox_2d": [100, 200, 300, 400]}}], []]
+只返回这个嵌套JSON数组！"""
+
+# 标志裁剪图最长边（像素）与四周留白
+SIGN_CROP_MAX_SIZE = 256
+SIGN_CROP_PADDING = 10
+
+# 标志精排：一次请求同时返回类型与细节
+SIGN_CLASSIFY_PROMPT = """请判断这个交通标志的类型和细节。
+
+类型 type：
+1. 限速标志（红圈白底，中间有数字）
+2. 禁止标志（红圈）
+3. 警告标志（三角形）
+4. 指示/方向标志（蓝色或绿色）
+5. 其他
+
+细节 value：
+- type 为 1 时：标志上的限速数字，如 "70"
+- type 为 4 时：1=方向指示牌，2=高速公路标志，3=倒计时距离牌（100m/200m/300m斜条），4=其他
+- 其他类型：""
+
+只返回 JSON，例如：{"type": 1, "value": "70"}"""
+
+# 固定的文本 content 块，模块加载时构建一次，每次请求只新建图片块
+# （SDK 与 httpx 序列化时都不会修改它；MappingProxyType 无法被 json 序列化，故用普通 dict）
+_DETECTION_PROMPT_BLOCK = {"type": "text", "text": DETECTION_PROMPT}
+_SIGN_PROMPT_BLOCK = {"type": "text", "text": SIGN_CLASSIFY_PROMPT}
+
 SIGNS_DIR = Path("raw_data/signs")
 
-def load_sign_candidates():
-    """从标志图片目录动态加载所有标志名称"""
+@lru_cache(maxsize=1)
+def load_sign_candidates() -> tuple:
+    """从标志图片目录动态加载所有标志名称（结果缓存为不可变 tuple）"""
     if not SIGNS_DIR.exists():
-        return []
-    return [f.stem for f in sorted(SIGNS_DIR.glob("*.png"))]
+        return ()
+    return tuple(sorted(f.stem for f in SIGNS_DIR.glob("*.png")))
 
 ALL_SIGN_CANDIDATES = load_sign_candidates()
 
 
+# 粗粒度类别关键词（按优先级排列，每个类别预编译为一个正则）
+CATEGORY_PATTERNS = [
+    (re.compile(r"pedestrian|person|people|child|cyclist|crowd"), "pedestrian"),
+    (re.compile(r"car|truck|bus|motorcycle|bicycle|van|suv|taxi|vehicle"), "vehicle"),
+    (re.compile(r"cone|construction|barrier|road_work|detour"), "construction"),
+    (re.compile(r"sign|speed|limit|no_|traffic|light|stop|give_way|direction|exit|lane|countdown"),
+     "traffic_sign"),
+]
+
+# 模型输出中的 JSON 数组（贪婪匹配第一个 [ 到最后一个 ]）
+_RE_JSON_ARRAY = re.compile(r'\[.*\]', re.DOTALL)
+
+# 标志精排回复解析
+_RE_SIGN_TYPE = re.compile(r'[1-5]')
+_RE_DIRECTION_DETAIL = re.compile(r'[1-4]')
+_RE_DIGITS = re.compile(r'\d+')
+
+
 # ============================================================================
 # 辅助函数
 # ============================================================================
 
+def _build_category_automaton():
+    """
+    把所有类别关键词编译成一个 Aho-Corasick 自动机（需要 pyahocorasick）
+    
+    每个关键词的值为 (优先级, 类别)，一次扫描拿到全部命中后取优先级最高者，
+    与按 CATEGORY_PATTERNS 顺序逐类匹配的结果一致。
+    """
+    if ahocorasick is None:
+        return None
+    
+    automaton = ahocorasick.Automaton()
+    for priority, (pattern, category) in enumerate(CATEGORY_PATTERNS):
+        for keyword in pattern.pattern.split("|"):
+            existing = automaton.get(keyword, None)
+            if existing is None or existing[0] > priority:
+                automaton.add_word(keyword, (priority, category))
+    automaton.make_automaton()
+    return automaton
+
+
 def get_category(label: str) -> str:
     """根据标签获取粗粒度类别"""
     label_lower = label.lower().replace(" ", "_").replace("-", "_")
     
-    if any(p in label_lower for p in ["pedestrian", "person", "people", "child", "cyclist", "crowd"]):
-        return "pedestrian"
-    if any(v in label_lower for v in ["car", "truck", "bus", "motorcycle", "bicycle", "van", "suv", "taxi", "vehicle"]):
-        return "vehicle"
-    if any(c in label_lower for c in ["cone", "construction", "barrier", "road_work", "detour"]):
-        return "construction"
-    if any(s in label_lower for s in ["sign", "speed", "limit", "no_", "traffic", "light", "stop", "give_way", "direction", "exit", "lane", "countdown"]):
-        return "traffic_sign"
+    if _CATEGORY_AUTOMATON is not None:
+        best = min((value for _, value in _CATEGORY_AUTOMATON.iter(label_lower)), default=None)
+        return best[1] if best else "unknown"
+    
+    for pattern, category in CATEGORY_PATTERNS:
+        if pattern.search(label_lower):
+            return category
     return "unknown"
 
 
+_CATEGORY_AUTOMATON = _build_category_automaton()
+
+
 def normalize_vehicle_label(label: str) -> str:
     """
     将所有车辆类型标签规范化为 vehicle 格式
@@ -96,302 +255,647 @@ def normalize_vehicle_label(label: str) -> str:
     return label
 
 
-def image_to_base64_url(image_path: str) -> str:
-    with open(image_path, 'rb') as f:
-        image_data = base64.b64encode(f.read()).decode('utf-8')
+@lru_cache(maxsize=64)
+def _cached_base64_url(image_path: str, mtime_ns: int, size: int) -> str:
+    """按 (路径, 修改时间, 大小) 缓存编码结果，文件变化后自动失效"""
+    # mmap 直接编码，按需分页读入，避免额外复制一份文件内容
+    with open(image_path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        image_data = base64.b64encode(mm).decode('ascii')
     ext = Path(image_path).suffix.lower()
     mime_type = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png'}.get(ext, 'image/jpeg')
     return f"data:{mime_type};base64,{image_data}"
 
 
+def image_to_base64_url(image_path: str) -> str:
+    st = os.stat(image_path)
+    return _cached_base64_url(image_path, st.st_mtime_ns, st.st_size)
+
+
+# 含尺寸信息的 JPEG SOF 标记（排除 DHT/JPG/DAC: 0xC4/0xC8/0xCC）
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _read_jpeg_size(f) -> tuple:
+    """
+    只扫描 JPEG 段头，从 SOF 段读取 (width, height)
+    
+    不解码像素，通常只需读取文件开头的几百字节。非 JPEG 或结构异常时返回 None。
+    """
+    if f.read(2) != b"\xff\xd8":
+        return None
+    
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":  # 跳过填充字节
+            byte = f.read(1)
+        if not byte:
+            return None
+        
+        marker = byte[0]
+        if marker in _JPEG_SOF_MARKERS:
+            header = f.read(7)
+            if len(header) < 7:
+                return None
+            height = int.from_bytes(header[3:5], "big")
+            width = int.from_bytes(header[5:7], "big")
+            return width, height
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:  # 无长度字段的标记
+            continue
+        
+        length = f.read(2)
+        if len(length) < 2:
+            return None
+        f.seek(int.from_bytes(length, "big") - 2, os.SEEK_CUR)
+
+
+@lru_cache(maxsize=4096)
 def get_image_size(image_path: str) -> tuple:
-    with Image.open(image_path) as img:
-        return img.width, img.height
+    """获取图片尺寸（按路径缓存，JPEG 直接解析文件头，其他格式交给 PIL）"""
+    with open(image_path, "rb") as f:
+        size = _read_jpeg_size(f)
+        if size is not None:
+            return size
+        f.seek(0)
+        with Image.open(f) as img:
+            return img.width, img.height
+
+
+class RateLimitGate:
+    """
+    所有 worker 共享的 429 退避闸门
+    
+    任一请求遇到 429 时推迟全局的 next_allowed 时间点，其余 worker 发请求前
+    统一等到该时间点，避免各自退避后同时醒来再次打满 API（惊群）。
+    """
+    
+    def __init__(self, initial_delay: float = 1.0, max_delay: float = 30.0):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._next_allowed = 0.0
+        self._strikes = 0
+    
+    def _remaining(self) -> float:
+        with self._lock:
+            return self._next_allowed - time.monotonic()
+    
+    async def wait_async(self) -> None:
+        """等待直到允许发送请求（协程版）"""
+        delay = self._remaining()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._remaining()
+    
+    def backoff(self, retry_after: float = None) -> None:
+        """记录一次 429：优先遵循 Retry-After，否则按带抖动的指数退避推迟"""
+        with self._lock:
+            self._strikes += 1
+            if retry_after is None:
+                retry_after = min(self.max_delay, self.initial_delay * 2 ** (self._strikes - 1))
+                retry_after *= random.uniform(0.5, 1.0)
+            self._next_allowed = max(self._next_allowed, time.monotonic() + retry_after)
+    
+    def success(self) -> None:
+        """请求成功后重置退避级数"""
+        if self._strikes:
+            with self._lock:
+                self._strikes = 0
+
+
+_RATE_GATE = RateLimitGate()
+
+
+def _rate_limit_retry_after(e: Exception):
+    """
+    判断异常是否为 429 限流
+    
+    Returns:
+        (is_rate_limited, retry_after 秒数或 None)
+    """
+    response = getattr(e, "response", None)
+    status = getattr(e, "status_code", None) or getattr(response, "status_code", None)
+    if status != 429:
+        return False, None
+    
+    try:
+        return True, float(response.headers.get("Retry-After"))
+    except (AttributeError, TypeError, ValueError):
+        return True, None
 
 
 # ============================================================================
 # 单张图片处理函数（用于并行）
 # ============================================================================
 
-def classify_sign_rag(client, image_path: str, bbox: list) -> str:
-    """RAG 二阶段交通标志精排（线程安全版）"""
-    import re
+def _parse_sign_reply(reply: str) -> tuple:
+    """
+    解析标志分类回复 {"type": N, "value": "..."}
     
-    temp_path = None  # 确保 finally 块可以访问
+    Returns:
+        (sign_type, value)，无法识别类型时 sign_type 为 None
+    """
+    start, end = reply.find("{"), reply.rfind("}")
+    if start != -1 and end > start:
+        try:
+            data = _json_loads(reply[start:end + 1])
+            sign_type = str(data.get("type", "")).strip()
+            if sign_type in {"1", "2", "3", "4", "5"}:
+                return sign_type, str(data.get("value", ""))
+        except (json.JSONDecodeError, AttributeError):
+            pass
     
-    try:
-        img = Image.open(image_path)
-        padding = 10
-        x1 = max(0, bbox[0] - padding)
-        y1 = max(0, bbox[1] - padding)
-        x2 = min(img.width, bbox[2] + padding)
-        y2 = min(img.height, bbox[3] + padding)
-        
-        sign_crop = img.crop((x1, y1, x2, y2))
-        # 使用 uuid 生成唯一文件名，避免多线程冲突
-        unique_id = uuid.uuid4()
-        temp_path = f"/tmp/sign_crop_{unique_id}.jpg"
-        sign_crop.save(temp_path, "JPEG")
-        
-        with open(temp_path, "rb") as f:
-            img_data = base64.b64encode(f.read()).decode()
-        
-        # 阶段1：判断类型
-        type_prompt = """请判断这是什么类型的交通标志：
-1. 限速标志（红圈白底，中间有数字）
-2. 禁止标志（红圈）
-3. 警告标志（三角形）
-4. 指示/方向标志（蓝色或绿色）
-5. 其他
+    # 兜底：第一个 1-5 的数字是类型，其后的内容作为细节
+    type_match = _RE_SIGN_TYPE.search(reply)
+    if not type_match:
+        return None, ""
+    return type_match.group(), reply[type_match.end():]
 
-只返回数字（1-5）。"""
-        
-        response1 = client.chat.completions.create(
-            model="glm-4.6v",
-            messages=[{
-                "role": "user",
-                "content": [
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_data}"}},
-                    {"type": "text", "text": type_prompt}
-                ]
-            }],
-            temperature=0.1
-        )
-        
-        type_response = response1.choices[0].message.content.strip()
-        type_match = re.search(r'[1-5]', type_response)
-        
-        if not type_match:
-            return "traffic_sign"
-        
-        sign_type = type_match.group()
-        
-        # 阶段2：细节识别
-        if sign_type == "1":  # 限速
-            detail_prompt = "请识别这个限速标志上的数字。只返回数字。"
-            response2 = client.chat.completions.create(
-                model="glm-4.6v",
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_data}"}},
-                        {"type": "text", "text": detail_prompt}
-                    ]
-                }],
-                temperature=0.1
-            )
-            numbers = re.findall(r'\d+', response2.choices[0].message.content)
-            if numbers:
-                return f"Speed_limit_{numbers[0]}_km_h"
-            return "Speed_limit"
+
+def _encode_sign_crop(image, bbox: list) -> str:
+    """
+    裁剪标志区域并编码为 Base64 Data URL（内存中完成，无临时文件）
+    
+    Args:
+        image: 图片路径，或已打开的 PIL Image（同一帧多个标志时复用）
+    """
+    img = image if isinstance(image, Image.Image) else Image.open(image)
+    padding = SIGN_CROP_PADDING
+    
+    # 整帧可能以 draft 模式缩小解码，bbox 是原图坐标，需要同比缩放
+    if getattr(img, "filename", ""):
+        scale = img.width / get_image_size(img.filename)[0]
+        if scale != 1:
+            bbox = [v * scale for v in bbox]
+            padding *= scale
+    
+    x1 = max(0, bbox[0] - padding)
+    y1 = max(0, bbox[1] - padding)
+    x2 = min(img.width, bbox[2] + padding)
+    y2 = min(img.height, bbox[3] + padding)
+    
+    sign_crop = img.crop((x1, y1, x2, y2))
+    # 标志分类只需粗粒度信息，限制最长边以减少上传字节与视觉 token
+    sign_crop.thumbnail((SIGN_CROP_MAX_SIZE, SIGN_CROP_MAX_SIZE), Image.BILINEAR)
+    
+    buf = io.BytesIO()
+    sign_crop.save(buf, "JPEG", quality=80)
+    img_data = base64.b64encode(buf.getvalue()).decode()
+    return f"data:image/jpeg;base64,{img_data}"
+
+
+def _sign_classify_messages(crop_url: str) -> list:
+    """标志精排请求的 messages"""
+    return [{
+        "role": "user",
+        "content": [
+            {"type": "image_url", "image_url": {"url": crop_url}},
+            _SIGN_PROMPT_BLOCK
+        ]
+    }]
+
+
+def _sign_label_from_reply(reply: str) -> str:
+    """将标志精排回复映射为细粒度标签"""
+    sign_type, value = _parse_sign_reply(reply)
+    
+    if sign_type is None:
+        return "traffic_sign"
+    
+    if sign_type == "1":  # 限速
+        numbers = _RE_DIGITS.findall(value)
+        if numbers:
+            return f"Speed_limit_{numbers[0]}_km_h"
+        return "Speed_limit"
+    
+    elif sign_type == "4":  # 方向/指示
+        detail = _RE_DIRECTION_DETAIL.search(value)
+        if detail:
+            label_map = {
+                "1": "Direction_sign",
+                "2": "Expressway_sign",
+                "3": "100m_Countdown_markers",
+                "4": "Direction_other"
+            }
+            return label_map.get(detail.group(), "Direction_sign")
+        return "Direction_sign"
+    
+    type_labels = {
+        "2": "Prohibition_sign",
+        "3": "Warning_sign",
+        "5": "traffic_sign"
+    }
+    return type_labels.get(sign_type, "traffic_sign")
+
+
+async def classify_sign_rag_async(http_client: httpx.AsyncClient, image,
+                                  bbox: list) -> str:
+    """RAG 交通标志精排（异步版，直接复用检测请求的连接池）"""
+    try:
+        # 裁剪与编码是 CPU/磁盘操作，放到线程中避免阻塞事件循环
+        crop_url = await asyncio.to_thread(_encode_sign_crop, image, bbox)
         
-        elif sign_type == "4":  # 方向/指示
-            # 检测是否为距离牌
-            detail_prompt = """这是一个指示或方向标志。请判断：
-1. 方向指示牌
-2. 高速公路标志
-3. 倒计时距离牌（100m/200m/300m斜条）
-4. 其他
-
-只返回数字（1-4）。"""
-            response2 = client.chat.completions.create(
-                model="glm-4.6v",
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_data}"}},
-                        {"type": "text", "text": detail_prompt}
-                    ]
-                }],
-                temperature=0.1
-            )
-            detail = re.search(r'[1-4]', response2.choices[0].message.content)
-            if detail:
-                label_map = {
-                    "1": "Direction_sign",
-                    "2": "Expressway_sign",
-                    "3": "100m_Countdown_markers",
-                    "4": "Direction_other"
-                }
-                return label_map.get(detail.group(), "Direction_sign")
-            return "Direction_sign"
+        await _RATE_GATE.wait_async()
+        response = await http_client.post("/chat/completions", json={
+            "model": MODEL_NAME,
+            "messages": _sign_classify_messages(crop_url),
+            "temperature": 0.1
+        })
+        response.raise_for_status()
+        _RATE_GATE.success()
         
-        type_labels = {
-            "2": "Prohibition_sign",
-            "3": "Warning_sign",
-            "5": "traffic_sign"
-        }
-        return type_labels.get(sign_type, "traffic_sign")
+        return _sign_label_from_reply(response.json()["choices"][0]["message"]["content"] or "")
         
     except Exception as e:
+        rate_limited, retry_after = _rate_limit_retry_after(e)
+        if rate_limited:
+            # 429 同样通知共享闸门退避，避免其余请求继续撞限流
+            _RATE_GATE.backoff(retry_after)
         return "traffic_sign"
-    
-    finally:
-        # ✅ 清理临时文件，防止磁盘空间泄漏
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except:
-                pass  # 忽略删除失败
 
 
-def process_single_image(args_tuple):
+def _open_frame(image_path: str, bboxes: list = ()) -> Image.Image:
     """
-    处理单张图片（线程安全）
+    打开并解码整帧，供同一帧的多个标志裁剪复用
     
-    Args:
-        args_tuple: (image_path, api_key, max_retries, use_rag)
+    传入 bboxes 时，若最小的裁剪区域缩小后最长边仍不低于 SIGN_CROP_MAX_SIZE，
+    则用 JPEG draft 模式让 libjpeg 直接按 1/2、1/4 或 1/8 解码，结果与全尺寸
+    解码后再 thumbnail 几乎一致，但 DCT 与内存开销成倍减少。
+    """
+    img = Image.open(image_path)
+    if bboxes:
+        min_edge = min(max(b[2] - b[0], b[3] - b[1]) for b in bboxes) + 2 * SIGN_CROP_PADDING
+        scale = SIGN_CROP_MAX_SIZE / max(min_edge, 1)
+        if scale <= 0.5:
+            # draft 只会选择不小于请求尺寸的最小缩放比例；非 JPEG 时为空操作
+            img.draft("RGB", (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+    img.load()
+    return img
+
+
+def _load_image(image_path: str) -> tuple:
+    """读取图片的 Base64 Data URL 与尺寸"""
+    return image_to_base64_url(image_path), get_image_size(image_path)
+
+
+def _extract_json_str(result_text: str) -> str:
+    """从模型输出中提取 JSON 数组文本（一次正则匹配，兼容 markdown 代码块包裹）"""
+    m = _RE_JSON_ARRAY.search(result_text)
+    if m:
+        return m.group()
+    # 没有闭合的 ]：可能是截断输出，交给调用方修复
+    start = result_text.find("[")
+    if start != -1:
+        return result_text[start:].strip()
+    return result_text.strip()
+
+
+def _parse_detections(result_text: str, width: int, height: int) -> list:
+    """
+    解析模型输出并做后处理（坐标换算、标签规范化）
     
-    Returns:
-        (image_path, detections, error)
+    Raises:
+        json.JSONDecodeError: JSON 无法解析
     """
-    image_path, api_key, max_retries, use_rag = args_tuple
+    json_str = _extract_json_str(result_text)
+    
+    if json_str == "[]" or json_str == "":
+        return []
     
     try:
-        # 每个线程创建自己的 client
-        client = ZaiClient(api_key=api_key)
-        
-        base64_url = image_to_base64_url(image_path)
-        width, height = get_image_size(image_path)
-        
-        prompt = """请检测图片中的以下4类物体，返回JSON格式。
+        detections = _json_loads(json_str)
+    except json.JSONDecodeError:
+        # 修复截断 JSON：从第一个 [ 起截到最后一个完整对象
+        tail = result_text[result_text.find("["):]
+        last_complete = tail.rfind("},")
+        if last_complete <= 0:
+            raise
+        detections = _json_loads(tail[:last_complete+1] + "]")
+    
+    return _post_process(detections, width, height)
 
-## 检测类别与细粒度要求：
 
-### 1. 行人类 (pedestrian) - 2种标签
-- pedestrian: 单个或少量行人
-- crowd: 人群（多人聚集）
+def _scale_bboxes(raw_bboxes: list, width: int, height: int) -> list:
+    """批量将 0-1000 归一化坐标换算为像素坐标"""
+    if not raw_bboxes:
+        return []
+    
+    if np is not None:
+        raw = np.asarray(raw_bboxes, dtype=np.float64)
+        if raw.ndim != 2 or raw.shape[1] != 4:
+            raise ValueError(f"invalid bbox_2d shape: {raw.shape}")
+        scale = np.array([width, height, width, height], dtype=np.float64)
+        # np.rint 与 round() 一样是四舍六入五成双
+        return np.rint(raw / 1000 * scale).astype(np.int64).tolist()
+    
+    return [
+        [
+            int(round(b[0] / 1000 * width)),
+            int(round(b[1] / 1000 * height)),
+            int(round(b[2] / 1000 * width)),
+            int(round(b[3] / 1000 * height))
+        ]
+        for b in raw_bboxes
+    ]
 
-### 2. 车辆类 (vehicle) - 5种标签
-统一使用 vehicle，只区分行驶状态：
 
-**状态判断规则**（按优先级）：
-1. **刹车状态**: 尾灯明显变亮、红色刹车灯亮起 → `vehicle_braking`
-2. **双闪状态**: 左右两侧转向灯同时亮起/闪烁 → `vehicle_double_flash`
-3. **右转状态**: 车身朝右/车头转向右侧/右转车道转弯/仅右侧转向灯亮 → `vehicle_turning_right`
-4. **左转状态**: 车身朝左/车头转向左侧/左转车道转弯/仅左侧转向灯亮 → `vehicle_turning_left`
-5. **正常状态**: 直行或无法判断 → `vehicle`
+def _post_process(detections: list, width: int, height: int) -> list:
+    """坐标换算（0-1000 → 像素）与标签规范化"""
+    valid = [det for det in detections if "label" in det and "bbox_2d" in det]
+    bboxes = _scale_bboxes([det["bbox_2d"] for det in valid], width, height)
+    
+    processed = []
+    for det, bbox in zip(valid, bboxes):
+        label = det["label"].lower().replace(" ", "_").replace("-", "_")
+        category = get_category(label)
+        
+        # 车辆标签规范化：将 car/truck/bus 等统一转换为 vehicle 格式
+        if category == "vehicle":
+            label = normalize_vehicle_label(label)
+        
+        processed.append({
+            "label": label,
+            "category": category,
+            "bbox": bbox
+        })
+    
+    return processed
 
-注意：
-- 不要标注第一人称视角的车辆（拍摄车辆本身）
-- 所有机动车（轿车、卡车、公交、摩托车等）和自行车都统一标注为 vehicle
 
-### 3. 交通标志类 (traffic_sign)
-traffic_sign
+def _needs_rag(det: dict) -> bool:
+    """是否需要 RAG 细粒度分类（仅通用交通标志）"""
+    return det["category"] == "traffic_sign" and det["label"] in ["traffic_sign", "sign"]
 
-### 4. 施工标志类 (construction)
-traffic_cone, construction_barrier
 
-## 返回格式示例：
-[
-  {"label": "vehicle_braking", "bbox_2d": [100, 200, 300, 400]},
-  {"label": "vehicle_double_flash", "bbox_2d": [400, 300, 600, 500]},
-  {"label": "vehicle_turning_left", "bbox_2d": [700, 200, 800, 400]},
-  {"label": "vehicle", "bbox_2d": [900, 300, 1100, 500]},
-  {"label": "traffic_sign", "bbox_2d": [50, 50, 80, 80]}
-]
+async def _refine_signs_async(http_client: httpx.AsyncClient, processed: list,
+                              image_path: str) -> None:
+    """RAG 细粒度分类（仅交通标志）"""
+    signs = [det for det in processed if _needs_rag(det)]
+    if not signs:
+        return
+    
+    # 整帧只解码一次，所有标志裁剪共用
+    frame = await asyncio.to_thread(_open_frame, image_path, [det["bbox"] for det in signs])
+    try:
+        for det in signs:
+            det["label"] = await classify_sign_rag_async(http_client, frame, det["bbox"])
+    finally:
+        frame.close()
 
-如果没有目标，返回 []
-只返回JSON数组！"""
 
+async def process_single_image_async(http_client: httpx.AsyncClient, image_path: str,
+                                     max_retries: int = 3, use_rag: bool = False,
+                                     prepare_pool: Executor = None):
+    """
+    处理单张图片（异步版本）
+    
+    Args:
+        http_client: 共享的 httpx.AsyncClient（复用连接池）
+        image_path: 图片路径
+        max_retries: 最大重试次数
+        use_rag: 是否启用 RAG 细粒度分类
+        prepare_pool: 执行读图 + base64 的执行器，None 为默认线程池
+    
+    Returns:
+        (image_path, detections, error, image_size)，读图失败时 image_size 为 None
+    """
+    size = None
+    try:
+        # 读文件 + base64 + PIL 解析放到执行器中，避免阻塞事件循环
+        loop = asyncio.get_running_loop()
+        base64_url, size = await loop.run_in_executor(
+            prepare_pool, _load_image, image_path
+        )
+        width, height = size
+        
+        payload = {
+            "model": MODEL_NAME,
+            "messages": [{
+                "role": "user",
+                "content": [
+                    {"type": "image_url", "image_url": {"url": base64_url}},
+                    _DETECTION_PROMPT_BLOCK
+                ]
+            }]
+        }
+        
         for attempt in range(max_retries):
             try:
-                response = client.chat.completions.create(
-                    model="glm-4.6v",
-                    messages=[{
-                        "role": "user",
-                        "content": [
-                            {"type": "image_url", "image_url": {"url": base64_url}},
-                            {"type": "text", "text": prompt}
-                        ]
-                    }]
-                )
+                await _RATE_GATE.wait_async()
+                response = await http_client.post("/chat/completions", json=payload)
+                response.raise_for_status()
+                _RATE_GATE.success()
                 
-                result_text = response.choices[0].message.content.strip()
+                result_text = (response.json()["choices"][0]["message"]["content"] or "").strip()
                 
                 if not result_text:
                     if attempt < max_retries - 1:
                         continue
-                    return (image_path, [], None)
-                
-                # 解析 JSON
-                if "```json" in result_text:
-                    json_str = result_text.split("```json")[1].split("```")[0].strip()
-                elif "```" in result_text:
-                    json_str = result_text.split("```")[1].split("```")[0].strip()
-                elif "[" in result_text:
-                    json_str = result_text[result_text.find("["):result_text.rfind("]")+1]
-                else:
-                    json_str = result_text.strip()
-                
-                if json_str == "[]" or json_str == "":
-                    return (image_path, [], None)
+                    return (image_path, [], None, size)
                 
-                # 修复截断 JSON
-                if json_str and not json_str.endswith("]"):
-                    last_complete = json_str.rfind("},")
-                    if last_complete > 0:
-                        json_str = json_str[:last_complete+1] + "]"
+                processed = _parse_detections(result_text, width, height)
                 
-                detections = json.loads(json_str)
-                processed = []
+                if use_rag:
+                    await _refine_signs_async(http_client, processed, image_path)
                 
-                for det in detections:
-                    if "label" not in det or "bbox_2d" not in det:
-                        continue
-                    
-                    raw_bbox = det["bbox_2d"]
-                    bbox = [
-                        int(round(raw_bbox[0] / 1000 * width)),
-                        int(round(raw_bbox[1] / 1000 * height)),
-                        int(round(raw_bbox[2] / 1000 * width)),
-                        int(round(raw_bbox[3] / 1000 * height))
-                    ]
-                    
-                    label = det["label"].lower().replace(" ", "_").replace("-", "_")
-                    category = get_category(label)
-                    
-                    # 车辆标签规范化：将 car/truck/bus 等统一转换为 vehicle 格式
-                    if category == "vehicle":
-                        label = normalize_vehicle_label(label)
-                    
-                    # RAG 细粒度分类（仅交通标志）
-                    if use_rag and category == "traffic_sign" and label in ["traffic_sign", "sign"]:
-                        label = classify_sign_rag(client, image_path, bbox)
-                        category = "traffic_sign"
-                    
-                    processed.append({
-                        "label": label,
-                        "category": category,
-                        "bbox": bbox
-                    })
-                
-                return (image_path, processed, None)
+                return (image_path, processed, None, size)
                 
             except json.JSONDecodeError:
                 if attempt < max_retries - 1:
-                    time.sleep(2 * (attempt + 1))  # 指数退避
+                    await asyncio.sleep(2 * (attempt + 1))  # 指数退避
                     continue
-                return (image_path, [], "JSON parse error")
+                return (image_path, [], "JSON parse error", size)
             except Exception as e:
                 if attempt < max_retries - 1:
-                    time.sleep(2 * (attempt + 1))  # 指数退避，避免 429 错误
+                    rate_limited, retry_after = _rate_limit_retry_after(e)
+                    if rate_limited:
+                        # 429 由共享闸门统一退避，下一轮请求前等待
+                        _RATE_GATE.backoff(retry_after)
+                    else:
+                        await asyncio.sleep(2 * (attempt + 1))  # 指数退避
                     continue
-                return (image_path, [], str(e))
+                return (image_path, [], str(e), size)
         
-        return (image_path, [], "Max retries exceeded")
+        return (image_path, [], "Max retries exceeded", size)
+    
+    except Exception as e:
+        return (image_path, [], str(e), size)
+
+
+async def process_image_batch_async(http_client: httpx.AsyncClient, image_paths: list,
+                                    max_retries: int = 3, use_rag: bool = False,
+                                    prepare_pool: Executor = None) -> list:
+    """
+    多张图片合并为一次请求检测（异步版本）
+    
+    所有图片放进同一条 message，要求模型按顺序返回嵌套数组。
+    请求失败时整批重试（429 先经共享闸门退避）；只有返回结果无法解析或
+    数量不符时才回退到逐张检测。RAG 细分逐张进行，单张失败不影响其余图片。
+    
+    Returns:
+        [(image_path, detections, error, image_size), ...]，顺序与 image_paths 一致
+    """
+    if len(image_paths) == 1:
+        return [await process_single_image_async(
+            http_client, image_paths[0], max_retries, use_rag, prepare_pool
+        )]
     
+    try:
+        loop = asyncio.get_running_loop()
+        loaded = await asyncio.gather(*[
+            loop.run_in_executor(prepare_pool, _load_image, p) for p in image_paths
+        ])
     except Exception as e:
-        return (image_path, [], str(e))
+        return [(p, [], str(e), None) for p in image_paths]
+    
+    sizes = [size for _, size in loaded]
+    content = [
+        {"type": "image_url", "image_url": {"url": base64_url}}
+        for base64_url, _ in loaded
+    ]
+    content.append({"type": "text", "text": build_batch_prompt(len(image_paths))})
+    payload = {
+        "model": MODEL_NAME,
+        "messages": [{"role": "user", "content": content}]
+    }
+    
+    for attempt in range(max_retries):
+        try:
+            await _RATE_GATE.wait_async()
+            response = await http_client.post("/chat/completions", json=payload)
+            response.raise_for_status()
+            _RATE_GATE.success()
+            break
+        except Exception as e:
+            if attempt == max_retries - 1:
+                return [(p, [], str(e), size) for p, size in zip(image_paths, sizes)]
+            rate_limited, retry_after = _rate_limit_retry_after(e)
+            if rate_limited:
+                # 429 由共享闸门统一退避后重试整批，不拆成 N 个单张请求
+                _RATE_GATE.backoff(retry_after)
+            else:
+                await asyncio.sleep(2 * (attempt + 1))  # 指数退避
+    
+    try:
+        result_text = (response.json()["choices"][0]["message"]["content"] or "").strip()
+        batch = _json_loads(_extract_json_str(result_text))
+        
+        if (not isinstance(batch, list) or len(batch) != len(image_paths)
+                or not all(isinstance(dets, list) for dets in batch)):
+            raise ValueError("batch size mismatch")
+        
+        processed_batch = [
+            _post_process(detections, width, height)
+            for (width, height), detections in zip(sizes, batch)
+        ]
+    except (ValueError, TypeError, KeyError, IndexError):
+        # 批量结果无法解析（含 JSONDecodeError），逐张回退（各自带重试）
+        return list(await asyncio.gather(*[
+            process_single_image_async(http_client, p, max_retries, use_rag, prepare_pool)
+            for p in image_paths
+        ]))
+    
+    results = []
+    for image_path, processed, size in zip(image_paths, processed_batch, sizes):
+        if use_rag:
+            try:
+                await _refine_signs_async(http_client, processed, image_path)
+            except Exception as e:
+                results.append((image_path, [], str(e), size))
+                continue
+        results.append((image_path, processed, None, size))
+    return results
+
+
+async def process_images_async(image_paths: list, api_key: str, workers: int = 5,
+                               use_rag: bool = False, max_retries: int = 3,
+                               batch_size: int = 1, prepare_processes: int = 0):
+    """
+    异步并发处理多张图片，按完成顺序逐个产出结果
+    
+    用 Semaphore 限制同时在途的请求数，所有请求共享一个连接池
+    （安装 h2 时启用 HTTP/2，多个请求复用同一条 TLS 连接）；
+    任务按滑动窗口创建，内存占用与图片总数无关。
+    batch_size > 1 时每个请求携带多张图片。
+    prepare_processes > 0 时读图 + base64 在进程池中执行，不受 GIL 限制。
+    
+    Yields:
+        (image_path, detections, error, image_size)
+    """
+    semaphore = asyncio.Semaphore(workers)
+    prepare_pool = ProcessPoolExecutor(prepare_processes) if prepare_processes > 0 else None
+    
+    try:
+        async with httpx.AsyncClient(
+            base_url=API_BASE_URL,
+            http2=HTTP2_ENABLED,
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            },
+            limits=httpx.Limits(max_connections=workers, max_keepalive_connections=workers)
+        ) as http_client:
+            
+            async def bounded(batch):
+                async with semaphore:  # 控制并发
+                    return await process_image_batch_async(
+                        http_client, batch, max_retries, use_rag, prepare_pool
+                    )
+            
+            # 滑动窗口：最多 2 * workers 个任务在途，不一次性为所有图片创建协程
+            batches = (image_paths[i:i + batch_size] for i in range(0, len(image_paths), batch_size))
+            window = 2 * workers
+            inflight = set()
+            try:
+                while True:
+                    for batch in islice(batches, window - len(inflight)):
+                        inflight.add(asyncio.create_task(bounded(batch)))
+                    if not inflight:
+                        break
+                    
+                    done, inflight = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        for result in task.result():
+                            yield result
+            finally:
+                for task in inflight:
+                    task.cancel()
+    finally:
+        if prepare_pool is not None:
+            prepare_pool.shutdown(wait=False, cancel_futures=True)
 
 
 # ============================================================================
 # 输出函数
 # ============================================================================
 
-def to_xanylabeling_format(detections: list, image_path: str) -> dict:
-    """转换为 X-AnyLabeling 格式"""
-    width, height = get_image_size(image_path)
+def _write_json(path: Path, data: dict) -> None:
+    """写出标注 JSON（有 orjson 时走 orjson，输出 UTF-8 + 2 空格缩进）"""
+    if orjson is not None:
+        # 整块 bytes 直接写 fd，绕过 Python 缓冲 IO
+        payload = memoryview(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            while payload:
+                payload = payload[os.write(fd, payload):]
+        finally:
+            os.close(fd)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def to_xanylabeling_format(detections: list, image_path: str, image_size: tuple = None) -> dict:
+    """
+    转换为 X-AnyLabeling 格式
+    
+    Args:
+        image_size: 已知的 (width, height)，提供时不再读取图片
+    """
+    width, height = image_size or get_image_size(image_path)
     
     shapes = []
     for det in detections:
@@ -422,12 +926,123 @@ def to_xanylabeling_format(detections: list, image_path: str) -> dict:
 # 主函数
 # ============================================================================
 
+def _file_digest(image_path: str) -> bytes:
+    """整文件内容的 BLAKE2b 摘要（mmap 读取，不额外复制）"""
+    with open(image_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.blake2b(b"", digest_size=16).digest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return hashlib.blake2b(mm, digest_size=16).digest()
+
+
+def group_duplicate_images(image_paths: list) -> tuple:
+    """
+    按文件内容对图片去重（视频抽帧在停车等场景常有逐字节相同的帧）
+    
+    Returns:
+        (unique_paths, duplicates)：duplicates 为 {代表路径: [内容相同的其他路径]}
+    """
+    first_by_digest = {}
+    unique_paths = []
+    duplicates = {}
+    
+    for image_path in image_paths:
+        digest = _file_digest(image_path)
+        primary = first_by_digest.setdefault(digest, image_path)
+        if primary is image_path:
+            unique_paths.append(image_path)
+        else:
+            duplicates.setdefault(primary, []).append(image_path)
+    
+    return unique_paths, duplicates
+
+
+async def run_labeling(image_files: list, output_dir: Path, api_key: str,
+                       workers: int, use_rag: bool, batch_size: int = 1,
+                       prepare_processes: int = 0, dedup: bool = True) -> tuple:
+    """
+    异步批量标注并保存结果
+    
+    dedup 为 True 时内容相同的图片只请求一次，结果复制给所有副本。
+    
+    Returns:
+        (stats, success_count, error_count)
+    """
+    stats = {"pedestrian": 0, "vehicle": 0, "traffic_sign": 0, "construction": 0}
+    success_count = 0
+    error_count = 0
+    total = len(image_files)
+    
+    image_paths = [str(img) for img in image_files]
+    duplicates = {}
+    if dedup:
+        image_paths, duplicates = await asyncio.to_thread(group_duplicate_images, image_paths)
+        if duplicates:
+            skipped = total - len(image_paths)
+            print(f"  ♻️ 跳过 {skipped} 张重复图片，复用相同内容的标注结果")
+    
+    results = process_images_async(image_paths, api_key, workers, use_rag,
+                                   batch_size=batch_size,
+                                   prepare_processes=prepare_processes)
+    
+    # 写盘交给独立线程池，不阻塞结果收集与后续网络请求
+    loop = asyncio.get_running_loop()
+    pending_writes = {}
+    
+    with ThreadPoolExecutor(max_workers=4, thread_name_prefix="json-writer") as writer_pool:
+        i = 0
+        async for result_path, detections, error, image_size in results:
+            # 结果同时分发给内容相同的副本（内容相同，尺寸也相同）
+            for image_path in [result_path, *duplicates.get(result_path, ())]:
+                i += 1
+                image_name = Path(image_path).name
+                
+                try:
+                    if error:
+                        print(f"  ⚠️ [{i}/{total}] {image_name}: {error}")
+                        error_count += 1
+                    else:
+                        # 统计
+                        for det in detections:
+                            stats[det["category"]] = stats.get(det["category"], 0) + 1
+                        
+                        # 保存
+                        annotation = to_xanylabeling_format(detections, image_path, image_size)
+                        output_path = output_dir / f"{Path(image_path).stem}.json"
+                        write = loop.run_in_executor(writer_pool, _write_json, output_path, annotation)
+                        pending_writes[write] = image_name
+                        
+                        emoji = "✅" if detections else "⚪"
+                        print(f"  {emoji} [{i}/{total}] {image_name}: {len(detections)} objects")
+                        success_count += 1
+                        
+                except Exception as e:
+                    print(f"  ❌ [{i}/{total}] {image_name}: {e}")
+                    error_count += 1
+        
+        # 等待所有写盘完成，写失败的计入错误
+        outcomes = await asyncio.gather(*pending_writes, return_exceptions=True)
+        for image_name, outcome in zip(pending_writes.values(), outcomes):
+            if isinstance(outcome, Exception):
+                print(f"  ❌ {image_name}: 保存失败 {outcome}")
+                success_count -= 1
+                error_count += 1
+    
+    return stats, success_count, error_count
+
+
 def main():
     parser = argparse.ArgumentParser(description="并行版自动标注脚本")
     parser.add_argument("--prefix", type=str, required=True, help="图片前缀 (如 D1, D2)")
     parser.add_argument("--limit", type=int, default=None, help="限制处理数量")
-    parser.add_argument("--workers", type=int, default=5, help="并行线程数 (默认 5)")
+    parser.add_argument("--workers", type=int, default=5, help="最大并发请求数 (默认 5)")
     parser.add_argument("--rag", action="store_true", help="启用 RAG 细粒度分类")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="每个请求携带的图片数 (默认 1，建议 4-8)")
+    parser.add_argument("--prepare-processes", type=int, default=0,
+                        help="读图/base64 编码的进程数 (默认 0 = 线程；大图可设为 CPU 核数)")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="不跳过内容相同的重复图片")
     parser.add_argument("--images-dir", type=str, default="test_images/extracted_frames")
     args = parser.parse_args()
     
@@ -453,56 +1068,25 @@ def main():
     output_dir = Path(f"output/{args.prefix.lower()}_annotations{rag_suffix}")
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # 准备参数
     width, height = get_image_size(str(image_files[0]))
-    task_args = [(str(img), api_key, 3, args.rag) for img in image_files]
     
     print("=" * 70)
     print(f"🚀 并行自动标注 - {args.prefix} series")
     print(f"   📁 Images: {len(image_files)} | Resolution: {width}x{height}")
-    print(f"   🔧 Workers: {args.workers} 个并行线程")
+    print(f"   🔧 Workers: {args.workers} 个并发请求")
     print(f"   🔍 RAG Mode: {'✅ Enabled' if args.rag else '❌ Disabled'}")
+    if args.batch_size > 1:
+        print(f"   📦 Batch: {args.batch_size} 张/请求")
     print("=" * 70)
     
     start_time = time.time()
     
-    # 统计
-    stats = {"pedestrian": 0, "vehicle": 0, "traffic_sign": 0, "construction": 0}
-    success_count = 0
-    error_count = 0
-    
-    # 并行处理
-    with ThreadPoolExecutor(max_workers=args.workers) as executor:
-        futures = {executor.submit(process_single_image, arg): arg[0] for arg in task_args}
-        
-        for i, future in enumerate(as_completed(futures)):
-            image_path = futures[future]
-            image_name = Path(image_path).name
-            
-            try:
-                _, detections, error = future.result()
-                
-                if error:
-                    print(f"  ⚠️ [{i+1}/{len(image_files)}] {image_name}: {error}")
-                    error_count += 1
-                else:
-                    # 统计
-                    for det in detections:
-                        stats[det["category"]] = stats.get(det["category"], 0) + 1
-                    
-                    # 保存
-                    annotation = to_xanylabeling_format(detections, image_path)
-                    output_path = output_dir / f"{Path(image_path).stem}.json"
-                    with open(output_path, "w", encoding="utf-8") as f:
-                        json.dump(annotation, f, ensure_ascii=False, indent=2)
-                    
-                    emoji = "✅" if detections else "⚪"
-                    print(f"  {emoji} [{i+1}/{len(image_files)}] {image_name}: {len(detections)} objects")
-                    success_count += 1
-                    
-            except Exception as e:
-                print(f"  ❌ [{i+1}/{len(image_files)}] {image_name}: {e}")
-                error_count += 1
+    # 异步并发处理
+    stats, success_count, error_count = asyncio.run(
+        run_labeling(image_files, output_dir, api_key, args.workers, args.rag,
+                     max(1, args.batch_size), max(0, args.prepare_processes),
+                     dedup=not args.no_dedup)
+    )
     
     elapsed = time.time() - start_time
     
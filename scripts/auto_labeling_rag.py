@@ -10,10 +10,12 @@ GLM-4.6V + RAG 增强标注脚本
     python3 auto_labeling_rag.py --prefix D1 --limit 10
 """
 
+import io
 import os
 import json
 import base64
 import argparse
+import threading
 from pathlib import Path
 from PIL import Image
 from zai import ZaiClient
@@ -42,6 +44,71 @@ def load_sign_candidates():
 # 加载所有候选标志
 ALL_SIGN_CANDIDATES = load_sign_candidates()
 
+# 送入 VLM 精排的候选数量（CLIP 预筛选后）
+RAG_TOP_K = 8
+
+
+class SignShortlister:
+    """
+    CLIP 图像向量预筛选
+    
+    启动时为所有标准标志图片计算一次归一化向量，
+    每个裁剪只需一次编码 + 一次矩阵乘即可取出最相似的 K 个候选。
+    """
+    
+    def __init__(self, candidates: list, model_name: str = "clip-ViT-B-32"):
+        from sentence_transformers import SentenceTransformer
+        
+        self.model = SentenceTransformer(model_name)
+        sign_images = []
+        for name in candidates:
+            with Image.open(SIGNS_DIR / f"{name}.png") as im:
+                sign_images.append(im.convert("RGB"))
+        # (N, D)，已 L2 归一化，点积即余弦相似度
+        self.sign_embeds = self.model.encode(
+            sign_images, convert_to_numpy=True, normalize_embeddings=True
+        )
+    
+    def top_k(self, crop: Image.Image, k: int) -> list:
+        """返回与裁剪最相似的 k 个候选下标（按相似度降序）"""
+        import numpy as np
+        
+        crop_embed = self.model.encode(
+            [crop.convert("RGB")], convert_to_numpy=True, normalize_embeddings=True
+        )[0]
+        scores = self.sign_embeds @ crop_embed
+        
+        if k >= len(scores):
+            return np.argsort(-scores).tolist()
+        top = np.argpartition(-scores, k)[:k]
+        return top[np.argsort(-scores[top])].tolist()
+
+
+_shortlister = None
+_shortlister_loaded = False
+_shortlister_lock = threading.Lock()
+
+
+def get_shortlister():
+    """
+    懒加载 CLIP 预筛选器（多个 worker 并发调用时只加载一次）
+    
+    未安装 sentence-transformers 或模型加载失败时返回 None（使用全量候选）。
+    """
+    global _shortlister, _shortlister_loaded
+    if not _shortlister_loaded:
+        with _shortlister_lock:
+            if not _shortlister_loaded:
+                if ALL_SIGN_CANDIDATES:
+                    try:
+                        _shortlister = SignShortlister(ALL_SIGN_CANDIDATES)
+                    except ImportError:
+                        print("⚠️ 未安装 sentence-transformers，RAG 使用全部候选")
+                    except Exception as e:
+                        print(f"⚠️ CLIP 预筛选模型加载失败（{e}），RAG 使用全部候选")
+                _shortlister_loaded = True
+    return _shortlister
+
 
 # ============================================================================
 # 辅助函数
@@ -79,13 +146,13 @@ def get_image_size(image_path: str) -> tuple:
 # RAG 细粒度分类
 # ============================================================================
 
-def classify_sign_with_rag(client: ZaiClient, image_path: str, bbox: list) -> str:
+def classify_sign_with_rag(client: ZaiClient, image, bbox: list) -> str:
     """
     对检测到的交通标志区域进行 RAG 细粒度分类
     
     Args:
         client: ZaiClient 实例
-        image_path: 原始图片路径
+        image: 原始图片路径，或已打开的 PIL Image（同一帧多个标志时复用）
         bbox: 标志区域 [x1, y1, x2, y2]
         
     Returns:
@@ -95,7 +162,7 @@ def classify_sign_with_rag(client: ZaiClient, image_path: str, bbox: list) -> st
     x1, y1, x2, y2 = bbox
     padding = 5
     
-    img = Image.open(image_path)
+    img = image if isinstance(image, Image.Image) else Image.open(image)
     x1 = max(0, x1 - padding)
     y1 = max(0, y1 - padding)
     x2 = min(img.width, x2 + padding)
@@ -104,16 +171,20 @@ def classify_sign_with_rag(client: ZaiClient, image_path: str, bbox: list) -> st
     # 裁剪标志区域
     sign_crop = img.crop((x1, y1, x2, y2))
     
-    # 保存临时文件
-    temp_path = "/tmp/sign_crop.jpg"
-    sign_crop.save(temp_path, "JPEG")
-    
-    # 读取并编码
-    with open(temp_path, "rb") as f:
-        img_data = base64.b64encode(f.read()).decode()
+    # 内存中编码一次，候选精排与二阶段精排共用（无临时文件，并发时也不会互相覆盖）
+    buf = io.BytesIO()
+    sign_crop.save(buf, "JPEG")
+    img_data = base64.b64encode(buf.getvalue()).decode()
     
-    # 构建候选列表
-    candidate_list = "\n".join([f"{i+1}. {c}" for i, c in enumerate(ALL_SIGN_CANDIDATES)])
+    # 候选列表：CLIP 预筛选出 top-K，不可用或编码出错时退回全量
+    candidates = ALL_SIGN_CANDIDATES
+    shortlister = get_shortlister()
+    if shortlister is not None:
+        try:
+            candidates = [ALL_SIGN_CANDIDATES[i] for i in shortlister.top_k(sign_crop, RAG_TOP_K)]
+        except Exception as e:
+            print(f"    ⚠️ CLIP 预筛选失败（{e}），使用全部候选")
+    candidate_list = "\n".join([f"{i+1}. {c}" for i, c in enumerate(candidates)])
     
     prompt = f"""请仔细观察这个交通标志，从以下选项中选择最匹配的：
 
@@ -147,8 +218,8 @@ def classify_sign_with_rag(client: ZaiClient, image_path: str, bbox: list) -> st
             numbers = re.findall(r'\d+', choice)
             if numbers:
                 idx = int(numbers[0]) - 1
-                if 0 <= idx < len(ALL_SIGN_CANDIDATES):
-                    base_label = ALL_SIGN_CANDIDATES[idx]
+                if 0 <= idx < len(candidates):
+                    base_label = candidates[idx]
         except:
             pass
         
@@ -279,6 +350,7 @@ def detect_objects(client: ZaiClient, image_path: str, use_rag: bool = False, ma
             
             detections = json.loads(json_str)
             processed = []
+            frame = None  # RAG 时整帧只打开一次，所有标志裁剪共用
             
             for det in detections:
                 if "label" not in det or "bbox_2d" not in det:
@@ -298,7 +370,10 @@ def detect_objects(client: ZaiClient, image_path: str, use_rag: bool = False, ma
                 # RAG 细粒度分类（仅对交通标志）
                 if use_rag and category == "traffic_sign" and label in ["traffic_sign", "sign"]:
                     print(f"    🔍 RAG 精排交通标志...")
-                    label = classify_sign_with_rag(client, image_path, bbox)
+                    if frame is None:
+                        frame = Image.open(image_path)
+                        frame.load()
+                    label = classify_sign_with_rag(client, frame, bbox)
                     print(f"    → {label}")
                 
                 processed.append({
@@ -307,6 +382,9 @@ def detect_objects(client: ZaiClient, image_path: str, use_rag: bool = False, ma
                     "bbox": bbox
                 })
             
+            if frame is not None:
+                frame.close()
+            
             return processed
             
         except json.JSONDecodeError as e:
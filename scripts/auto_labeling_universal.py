@@ -8,86 +8,193 @@ GLM-4.6V 通用数据标注脚本
     python3 auto_labeling_universal.py --prefix D4 --limit 50
 """
 
+import io
 import os
+import math
+import re
 import sys
 import json
+import time
+import random
 import base64
+import asyncio
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
+import httpx
 from PIL import Image
 from zai import ZaiClient
 
+try:
+    import numpy as np
+except ImportError:
+    # 可选依赖：未安装时逐个换算坐标
+    np = None
+
+try:
+    import orjson
+except ImportError:
+    # 可选依赖：未安装时回退到标准库 json
+    orjson = None
+
+# orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，调用方的异常处理不变
+_json_loads = orjson.loads if orjson is not None else json.loads
+
 # ============================================================================
 # 配置
 # ============================================================================
 API_KEY = os.getenv("ZAI_API_KEY", "")
 
+DETECTION_PROMPT = """请检测图片中的以下4类物体，返回JSON格式。
+
+## 检测类别（使用英文标签）：
+1. 行人：pedestrian, cyclist, child
+   - 如果行人很多（超过5人），可以用 crowd 标签框住整个人群区域
+2. 车辆：car, truck, bus, motorcycle, bicycle, van, taxi（不要标注第一人称摩托车/自行车）
+3. 交通标志：speed_limit_30/50/60/70/80, no_entry, no_parking, stop, traffic_light, direction_sign 等
+4. 施工标志：traffic_cone, construction_barrier
+
+## 返回格式：
+[{"label": "car", "bbox_2d": [xmin, ymin, xmax, ymax]}, {"label": "crowd", "bbox_2d": [x1, y1, x2, y2]}]
+
+如果没有目标，返回 []
+
+重要：只返回JSON数组，不要其他文字！"""
+
+# 固定的文本 content 块，每次请求只新建图片块（SDK 序列化时不会修改它）
+_DETECTION_PROMPT_BLOCK = {"type": "text", "text": DETECTION_PROMPT}
+
 # ============================================================================
 # 标签体系（与 v2 相同）
 # ============================================================================
 
+# 各类别关键词（按优先级排列）
+CATEGORY_KEYWORDS = {
+    "pedestrian": ["pedestrian", "person", "people", "child", "cyclist", "crowd"],
+    "vehicle": ["car", "truck", "bus", "motorcycle", "bicycle", "van", "suv", "taxi", "vehicle"],
+    "construction": ["cone", "construction", "barrier", "road_work", "detour"],
+    "traffic_sign": ["sign", "speed", "limit", "no_", "traffic", "light", "stop", "give_way", "direction", "exit", "lane"],
+}
+
+# 单个正则完成分类：从开头锚定，按优先级依次尝试每个类别的前瞻，
+# 命中的空命名组即类别名（lastgroup），与逐类 any() 的优先级一致
+_CATEGORY_RE = re.compile("^(?:" + "|".join(
+    f"(?=.*?(?:{'|'.join(map(re.escape, keywords))}))(?P<{category}>)"
+    for category, keywords in CATEGORY_KEYWORDS.items()
+) + ")", re.DOTALL)
+
+_LABEL_SEPARATORS = str.maketrans({" ": "_", "-": "_"})
+
+
+@lru_cache(maxsize=4096)
 def get_category(label: str) -> str:
     """根据标签获取粗颗粒度类别"""
-    label_lower = label.lower().replace(" ", "_").replace("-", "_")
-    
-    if any(p in label_lower for p in ["pedestrian", "person", "people", "child", "cyclist", "crowd"]):
-        return "pedestrian"
-    if any(v in label_lower for v in ["car", "truck", "bus", "motorcycle", "bicycle", "van", "suv", "taxi", "vehicle"]):
-        return "vehicle"
-    if any(c in label_lower for c in ["cone", "construction", "barrier", "road_work", "detour"]):
-        return "construction"
-    if any(s in label_lower for s in ["sign", "speed", "limit", "no_", "traffic", "light", "stop", "give_way", "direction", "exit", "lane"]):
-        return "traffic_sign"
-    return "unknown"
+    match = _CATEGORY_RE.match(label.lower().translate(_LABEL_SEPARATORS))
+    return sys.intern(match.lastgroup) if match else "unknown"
+
+
+# 中文标签 → 英文标签
+LABEL_MAPPING = {
+    "行人": "pedestrian", "人": "pedestrian", "路人": "pedestrian",
+    "骑车人": "cyclist", "骑自行车的人": "cyclist",
+    "儿童": "child", "小孩": "child",
+    "车": "car", "汽车": "car", "轿车": "car", "小汽车": "car",
+    "货车": "truck", "卡车": "truck",
+    "公交车": "bus", "巴士": "bus",
+    "摩托车": "motorcycle", "电动车": "motorcycle",
+    "自行车": "bicycle",
+    "面包车": "van", "越野车": "suv", "出租车": "taxi",
+    "车辆": "car",
+    "限速": "speed_limit", "限速牌": "speed_limit",
+    "限速70": "speed_limit_70", "限速60": "speed_limit_60",
+    "限速80": "speed_limit_80", "限速100": "speed_limit_100",
+    "禁止停车": "no_parking", "禁止驶入": "no_entry",
+    "红绿灯": "traffic_light", "交通灯": "traffic_light",
+    "指示牌": "direction_sign", "路牌": "street_sign",
+    "交通标志": "traffic_sign", "标志": "traffic_sign",
+    "锥桶": "traffic_cone", "路锥": "traffic_cone",
+    "施工": "construction",
+}
 
+# 所有中文关键词编译为一个正则，长词优先，一次扫描找到最左侧的最长匹配
+_LABEL_MAPPING_RE = re.compile(
+    "|".join(map(re.escape, sorted(LABEL_MAPPING, key=len, reverse=True)))
+)
 
+
+@lru_cache(maxsize=4096)
 def normalize_label(label: str) -> str:
-    """标准化标签为英文格式"""
+    """标准化标签为英文格式（标签在各帧间大量重复，结果按原始标签缓存）"""
     label = label.strip().lower()
     
-    mapping = {
-        "行人": "pedestrian", "人": "pedestrian", "路人": "pedestrian",
-        "骑车人": "cyclist", "骑自行车的人": "cyclist",
-        "儿童": "child", "小孩": "child",
-        "车": "car", "汽车": "car", "轿车": "car", "小汽车": "car",
-        "货车": "truck", "卡车": "truck",
-        "公交车": "bus", "巴士": "bus",
-        "摩托车": "motorcycle", "电动车": "motorcycle",
-        "自行车": "bicycle",
-        "面包车": "van", "越野车": "suv", "出租车": "taxi",
-        "车辆": "car",
-        "限速": "speed_limit", "限速牌": "speed_limit",
-        "限速70": "speed_limit_70", "限速60": "speed_limit_60",
-        "限速80": "speed_limit_80", "限速100": "speed_limit_100",
-        "禁止停车": "no_parking", "禁止驶入": "no_entry",
-        "红绿灯": "traffic_light", "交通灯": "traffic_light",
-        "指示牌": "direction_sign", "路牌": "street_sign",
-        "交通标志": "traffic_sign", "标志": "traffic_sign",
-        "锥桶": "traffic_cone", "路锥": "traffic_cone",
-        "施工": "construction",
-    }
-    
-    if label in mapping:
-        return mapping[label]
-    for cn, en in mapping.items():
-        if cn in label:
-            return en
-    return label.replace(" ", "_").replace("-", "_")
+    if label in LABEL_MAPPING:
+        return LABEL_MAPPING[label]
+    match = _LABEL_MAPPING_RE.search(label)
+    if match:
+        return LABEL_MAPPING[match.group(0)]
+    # 不同写法（大小写、空格）会归一成同一个标签，驻留后所有检测结果共用一个对象
+    return sys.intern(label.translate(_LABEL_SEPARATORS))
 
 
 # ============================================================================
 # 工具函数
 # ============================================================================
 
-def image_to_base64_url(image_path: str) -> str:
-    with open(image_path, 'rb') as f:
-        image_data = base64.b64encode(f.read()).decode('utf-8')
+# 分块编码的块大小，需为 3 的倍数，保证块之间不产生 base64 填充
+BASE64_CHUNK_SIZE = 48 * 1024
+
+# 上传给模型的图片最长边（像素）；模型返回 0-1000 归一化坐标，缩小不影响 bbox 还原
+MAX_UPLOAD_SIDE = 1280
+
+
+def load_image(image_path: str) -> tuple:
+    """
+    读取图片，一次 open 同时得到尺寸与上传用的 Base64 Data URL
+    
+    尺寸只需解析文件头；最长边超过 MAX_UPLOAD_SIDE 时在同一个 Image 上
+    缩小解码并重新编码，否则直接流式编码原文件字节，不解码像素。
+    
+    Returns:
+        (base64_url, (width, height))，尺寸为原图尺寸
+    """
+    with Image.open(image_path) as img:
+        size = img.size
+        if MAX_UPLOAD_SIDE and max(size) > MAX_UPLOAD_SIDE:
+            return _downscaled_base64_url(img), size
+    return _stream_base64_url(image_path), size
+
+
+def _stream_base64_url(image_path: str) -> str:
+    """原文件字节编码为 Data URL"""
     ext = Path(image_path).suffix.lower()
-    mime_type = {'jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png'}.get(ext, 'image/jpeg')
-    return f"data:{mime_type};base64,{image_data}"
+    mime_type = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png'}.get(ext, 'image/jpeg')
+    
+    # 分块读取并编码进同一个 bytearray（前缀一并写入），最后只 decode 一次，
+    # 不再同时持有整文件 bytes、base64 bytes 和拼接后的 str 三份数据
+    url = bytearray(f"data:{mime_type};base64,".encode('ascii'))
+    with open(image_path, 'rb') as f:
+        while chunk := f.read(BASE64_CHUNK_SIZE):
+            url += base64.b64encode(chunk)
+    return url.decode('ascii')
+
 
+def _downscaled_base64_url(img: Image.Image) -> str:
+    """缩小到 MAX_UPLOAD_SIDE 以内并重新编码为 JPEG，减少上传字节与视觉 token"""
+    # JPEG 可直接按 1/2、1/4、1/8 缩小解码，draft 保证结果不小于目标尺寸
+    scale = MAX_UPLOAD_SIDE / max(img.size)
+    img.draft("RGB", (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+    img = img.convert("RGB")
+    img.thumbnail((MAX_UPLOAD_SIDE, MAX_UPLOAD_SIDE), Image.BILINEAR)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=85)
+    return "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode('ascii')
 
+
+@lru_cache(maxsize=4096)
 def get_image_size(image_path: str) -> tuple:
+    """获取图片尺寸（按路径缓存，检测与导出阶段共用一次 Image.open）"""
     with Image.open(image_path) as img:
         return img.width, img.height
 
@@ -96,113 +203,218 @@ def get_image_size(image_path: str) -> tuple:
 # 检测函数
 # ============================================================================
 
-def detect_objects(client: ZaiClient, image_path: str, max_retries: int = 3) -> list:
-    base64_url = image_to_base64_url(image_path)
-    width, height = get_image_size(image_path)
+def create_client(api_key: str, max_connections: int) -> ZaiClient:
+    """
+    创建所有 worker 共享的 ZaiClient
     
-    prompt = """请检测图片中的以下4类物体，返回JSON格式。
+    SDK 默认连接池只保留 10 个 keep-alive 连接，并发更高时多出的连接用完即关、
+    下次请求重新握手 TLS。这里按并发数配置连接池，让每个 worker 都复用长连接。
+    """
+    http_client = httpx.Client(
+        timeout=httpx.Timeout(300.0, connect=8.0),
+        limits=httpx.Limits(max_connections=max_connections,
+                            max_keepalive_connections=max_connections),
+    )
+    return ZaiClient(api_key=api_key, http_client=http_client)
 
-## 检测类别（使用英文标签）：
-1. 行人：pedestrian, cyclist, child
-   - 如果行人很多（超过5人），可以用 crowd 标签框住整个人群区域
-2. 车辆：car, truck, bus, motorcycle, bicycle, van, taxi（不要标注第一人称摩托车/自行车）
-3. 交通标志：speed_limit_30/50/60/70/80, no_entry, no_parking, stop, traffic_light, direction_sign 等
-4. 施工标志：traffic_cone, construction_barrier
 
-## 返回格式：
-[{"label": "car", "bbox_2d": [xmin, ymin, xmax, ymax]}, {"label": "crowd", "bbox_2d": [x1, y1, x2, y2]}]
+class EmptyResponseError(Exception):
+    """模型返回了空内容"""
 
-如果没有目标，返回 []
 
-重要：只返回JSON数组，不要其他文字！"""
+class DetectionError(Exception):
+    """重试耗尽仍未拿到可用的检测结果"""
+
+
+# 重试等待：带抖动的指数退避（秒）
+RETRY_INITIAL_DELAY = 1.0
+RETRY_MAX_DELAY = 10.0
+
+
+def _retry_delay(attempt: int, initial: float = RETRY_INITIAL_DELAY) -> float:
+    """第 attempt 次（从 0 开始）失败后的等待时间，抖动避免并发 worker 同时重试"""
+    return random.uniform(0.5, 1.0) * min(RETRY_MAX_DELAY, initial * 2 ** attempt)
 
+
+def _is_rate_limited(e: Exception) -> bool:
+    """是否为 429 限流错误"""
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    return status == 429
+
+
+def _request_detections(client: ZaiClient, messages: list) -> list:
+    """
+    发送一次检测请求并解析结果数组
+    
+    截断的 JSON 在本地恢复，不触发重试。
+    
+    Raises:
+        EmptyResponseError: 模型返回空内容
+        json.JSONDecodeError: 回复中没有可解析的 JSON 数组
+    """
+    response = client.chat.completions.create(
+        model="glm-4.6v",
+        messages=messages
+    )
+    
+    result_text = response.choices[0].message.content
+    if not result_text or not result_text.strip():
+        raise EmptyResponseError("empty response")
+    return parse_detections_json(result_text)
+
+
+def detect_objects(client: ZaiClient, image_path: str, max_retries: int = 3,
+                   loaded: tuple = None, limiter: "RateLimiter" = None) -> list:
+    """
+    检测单张图片
+    
+    Args:
+        loaded: 已由 load_image 读取的 (base64_url, (width, height))，避免重复打开图片
+        limiter: RPM 限流器，每次请求（含重试）前各领取一个时间槽
+    
+    Raises:
+        DetectionError: 重试耗尽仍为空回复 / 无法解析
+        Exception: 非限流的请求错误原样抛出，由调用方按失败帧处理
+    """
+    base64_url, (width, height) = loaded or load_image(image_path)
+    image_name = Path(image_path).name
+    
+    # 图片与提示词在重试间不变，messages 只构建一次
+    messages = [{"role": "user", "content": [
+        {"type": "image_url", "image_url": {"url": base64_url}},
+        _DETECTION_PROMPT_BLOCK
+    ]}]
+    
+    # 空回复、无法解析、429 限流可重试，其他错误直接放弃
     for attempt in range(max_retries):
+        if limiter is not None:
+            limiter.acquire()
         try:
-            response = client.chat.completions.create(
-                model="glm-4.6v",
-                messages=[{"role": "user", "content": [
-                    {"type": "image_url", "image_url": {"url": base64_url}},
-                    {"type": "text", "text": prompt}
-                ]}]
-            )
-            
-            result_text = response.choices[0].message.content
-            
-            # 如果返回为空，重试
-            if not result_text or result_text.strip() == "":
-                if attempt < max_retries - 1:
-                    print(f"  ⚠️ Empty response, retrying ({attempt + 2}/{max_retries})...")
-                    continue
-                else:
-                    print(f"  ⚠️ Empty response after {max_retries} attempts")
-                    return []
-            
-            # 解析 JSON
-            if "```json" in result_text:
-                json_str = result_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in result_text:
-                json_str = result_text.split("```")[1].split("```")[0].strip()
-            elif "[" in result_text:
-                json_str = result_text[result_text.find("["):result_text.rfind("]")+1]
-            else:
-                json_str = result_text.strip()
-            
-            # 处理空数组情况
-            if json_str == "[]" or json_str == "":
-                return []
-            
-            # 修复被截断的 JSON（如果最后一个元素不完整）
-            if json_str and not json_str.endswith("]"):
-                # 找到最后一个完整的对象
-                last_complete = json_str.rfind("},")
-                if last_complete > 0:
-                    json_str = json_str[:last_complete+1] + "]"
-                    print(f"  ⚠️ JSON truncated, recovered {json_str.count('label')} objects")
-                else:
-                    # 尝试补全
-                    json_str = json_str.rstrip(",") + "]"
-            
-            detections = json.loads(json_str)
-            processed = []
-            
-            for det in detections:
-                if "label" not in det or "bbox_2d" not in det:
-                    continue
-                raw_bbox = det["bbox_2d"]
-                bbox = [
-                    int(round(raw_bbox[0] / 1000 * width)),
-                    int(round(raw_bbox[1] / 1000 * height)),
-                    int(round(raw_bbox[2] / 1000 * width)),
-                    int(round(raw_bbox[3] / 1000 * height))
-                ]
-                bbox = [max(0, min(bbox[0], width)), max(0, min(bbox[1], height)),
-                        max(0, min(bbox[2], width)), max(0, min(bbox[3], height))]
-                
-                label = normalize_label(det["label"])
-                processed.append({
-                    "label": label,
-                    "category": get_category(label),
-                    "bbox": bbox,
-                    "original": det["label"]
-                })
-            return processed
-            
-        except json.JSONDecodeError as e:
-            if attempt < max_retries - 1:
-                print(f"  ⚠️ JSON parse error, retrying ({attempt + 2}/{max_retries})...")
-                continue
-            else:
-                print(f"  ⚠️ JSON parse error after {max_retries} attempts: {e}")
-                return []
+            detections = _request_detections(client, messages)
+            break
+        except (EmptyResponseError, json.JSONDecodeError) as e:
+            reason = "Empty response" if isinstance(e, EmptyResponseError) else "JSON parse error"
+            if attempt == max_retries - 1:
+                raise DetectionError(f"{reason} after {max_retries} attempts") from e
+            delay = _retry_delay(attempt)
         except Exception as e:
-            print(f"  ⚠️ Unexpected error: {e}")
-            return []
+            if not _is_rate_limited(e) or attempt == max_retries - 1:
+                raise
+            reason = "Rate limited (429)"
+            delay = _retry_delay(attempt, initial=2 * RETRY_INITIAL_DELAY)
+        
+        print(f"  ⚠️ {image_name}: {reason}, retrying in {delay:.1f}s ({attempt + 2}/{max_retries})...")
+        time.sleep(delay)
+    else:
+        raise DetectionError(f"no result after {max_retries} attempts")
+    
+    valid = [det for det in detections if "label" in det and "bbox_2d" in det]
+    bboxes = scale_bboxes([det["bbox_2d"] for det in valid], width, height)
+    
+    processed = []
+    for det, bbox in zip(valid, bboxes):
+        label = normalize_label(det["label"])
+        processed.append({
+            "label": label,
+            "category": get_category(label),
+            "bbox": bbox,
+            "original": det["label"]
+        })
+    return processed
+
+
+def write_annotation(path: Path, annotation: dict) -> None:
+    """写出标注 JSON（有 orjson 时走 orjson，输出 UTF-8 + 2 空格缩进）"""
+    if orjson is not None:
+        path.write_bytes(orjson.dumps(annotation, option=orjson.OPT_INDENT_2))
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(annotation, f, ensure_ascii=False, indent=2)
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+# 截断恢复时的起点：第一个 "[{" 形式的对象数组
+_OBJECT_ARRAY_START_RE = re.compile(r"\[\s*\{")
+
+
+def _is_detection_list(value) -> bool:
+    """是否为对象数组（检测结果的形状）"""
+    return isinstance(value, list) and all(isinstance(item, dict) for item in value)
+
+
+def parse_detections_json(text: str) -> list:
+    """
+    从模型回复中解析检测结果数组
+    
+    从第一个 [ 起用 raw_decode 解析，自动忽略前后的 ``` 围栏与说明文字；
+    解析失败或得到的不是对象数组（如说明文字里的 "see [4]"）时继续尝试后面的 [，
+    优先返回非空的对象数组。都不可用时视为数组被截断，截到最后一个完整对象。
+    """
+    first = text.find("[")
+    if first < 0:
+        raise json.JSONDecodeError("no JSON array in response", text, 0)
+    
+    empty = None
+    start = first
+    while start >= 0:
+        try:
+            value, _ = _JSON_DECODER.raw_decode(text, start)
+        except json.JSONDecodeError:
+            pass
+        else:
+            if _is_detection_list(value):
+                if value:
+                    return value
+                if empty is None:
+                    empty = value
+        start = text.find("[", start + 1)
     
-    return []
+    if empty is not None:
+        return empty
+    
+    m = _OBJECT_ARRAY_START_RE.search(text)
+    start = m.start() if m else first
+    
+    # 修复被截断的 JSON（如果最后一个元素不完整）
+    tail = text[start:].rstrip().rstrip("`").rstrip()
+    last_complete = tail.rfind("},")
+    if last_complete > 0:
+        json_str = tail[:last_complete+1] + "]"
+        print(f"  ⚠️ JSON truncated, recovered {json_str.count('label')} objects")
+    else:
+        # 尝试补全
+        json_str = tail.rstrip(",") + "]"
+    return _json_loads(json_str)
+
+
+def scale_bboxes(raw_bboxes: list, width: int, height: int) -> list:
+    """批量将 0-1000 归一化坐标换算为像素坐标，并裁剪到图片范围内"""
+    if not raw_bboxes:
+        return []
+    
+    if np is not None:
+        raw = np.asarray(raw_bboxes, dtype=np.float64)
+        if raw.ndim != 2 or raw.shape[1] != 4:
+            raise ValueError(f"invalid bbox_2d shape: {raw.shape}")
+        limit = np.array([width, height, width, height], dtype=np.float64)
+        # np.rint 与 round() 一样是四舍六入五成双
+        return np.clip(np.rint(raw / 1000 * limit), 0, limit).astype(np.int64).tolist()
+    
+    bboxes = []
+    for b in raw_bboxes:
+        x1 = int(round(b[0] / 1000 * width))
+        y1 = int(round(b[1] / 1000 * height))
+        x2 = int(round(b[2] / 1000 * width))
+        y2 = int(round(b[3] / 1000 * height))
+        bboxes.append([max(0, min(x1, width)), max(0, min(y1, height)),
+                       max(0, min(x2, width)), max(0, min(y2, height))])
+    return bboxes
 
 
-def to_xanylabeling_format(detections: list, image_path: str) -> dict:
-    width, height = get_image_size(image_path)
+def to_xanylabeling_format(detections: list, image_path: str, image_size: tuple = None) -> dict:
+    width, height = image_size or get_image_size(image_path)
     shapes = []
     for det in detections:
         x1, y1, x2, y2 = det["bbox"]
@@ -225,11 +437,133 @@ def to_xanylabeling_format(detections: list, image_path: str) -> dict:
 # 主函数
 # ============================================================================
 
+def list_images(images_dir: Path, prefix: str) -> list:
+    """
+    列出 {prefix}_*.jpg 帧图片（已排序）
+    
+    用 os.scandir 单次遍历并做前后缀判断，不对每个目录项做 fnmatch 匹配，
+    也不额外 stat（scandir 自带文件类型）。目录不存在时返回空列表。
+    """
+    if not images_dir.is_dir():
+        return []
+    
+    name_prefix = f"{prefix}_"
+    with os.scandir(images_dir) as entries:
+        return sorted(
+            Path(entry.path) for entry in entries
+            if entry.name.startswith(name_prefix) and entry.name.endswith(".jpg") and entry.is_file()
+        )
+
+
+CATEGORY_EMOJI = {"pedestrian": "🔴", "vehicle": "🟢", "traffic_sign": "🔵", "construction": "🟠"}
+
+
+class RateLimiter:
+    """
+    按每分钟请求数（RPM）匀速放行的限流器（线程安全）
+    
+    每个请求占用一个 60/rpm 秒的时间槽，突发请求排队等待，
+    把请求速率压在服务端配额以下，避免 429 后整张图片重新上传。
+    在检测线程中逐次请求调用，重试同样计入配额。
+    """
+    
+    def __init__(self, rpm: int):
+        self.interval = 60.0 / rpm
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> None:
+        """领取下一个时间槽，未到时间则阻塞当前线程等待"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+async def label_images(client: ZaiClient, images: list, output_dir: Path, concurrency: int,
+                       rpm: int = 0, verbose: bool = False) -> dict:
+    """
+    并发检测所有图片，按完成顺序写出标注
+    
+    请求耗时几乎全在网络等待上，用 Semaphore 限制同时在途的请求数，
+    同步 SDK 调用放进同样大小的线程池执行。rpm > 0 时每次请求（含重试）按 RPM 匀速放行。
+    每帧只输出一行进度，verbose 时附带逐个目标的明细。
+    
+    Returns:
+        各类别的目标计数
+    """
+    stats = {"pedestrian": 0, "vehicle": 0, "traffic_sign": 0, "construction": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rpm) if rpm > 0 else None
+    loop = asyncio.get_running_loop()
+    
+    # 写盘交给独立线程池，不阻塞结果收集与后续网络请求
+    pending_writes = {}
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as pool, \
+            ThreadPoolExecutor(max_workers=4, thread_name_prefix="json-writer") as writer_pool:
+        
+        async def bounded(img_path: Path):
+            async with semaphore:
+                try:
+                    # 图片只打开一次，尺寸与编码结果一起传给检测和导出
+                    loaded = await loop.run_in_executor(pool, load_image, str(img_path))
+                    detections = await loop.run_in_executor(
+                        pool, partial(detect_objects, client, str(img_path), loaded=loaded, limiter=limiter)
+                    )
+                    return img_path, loaded[1], detections, None
+                except Exception as e:
+                    return img_path, None, [], e
+        
+        total = len(images)
+        for i, future in enumerate(asyncio.as_completed([bounded(p) for p in images]), 1):
+            img_path, image_size, detections, error = await future
+            
+            try:
+                if error:
+                    raise error
+                
+                for det in detections:
+                    stats[det["category"]] = stats.get(det["category"], 0) + 1
+                
+                annotation = to_xanylabeling_format(detections, str(img_path), image_size)
+                write = loop.run_in_executor(writer_pool, write_annotation,
+                                             output_dir / f"{img_path.stem}.json", annotation)
+                pending_writes[write] = img_path.name
+                
+                lines = [f"  ✅ [{i}/{total}] {img_path.name}: {len(detections)} objects"]
+                if verbose:
+                    lines.extend(
+                        f"     {CATEGORY_EMOJI.get(det['category'], '⚪')} {det['label']} "
+                        f"[{det['category']}] {det['bbox']}"
+                        for det in detections
+                    )
+                print("\n".join(lines))
+                
+            except Exception as e:
+                print(f"  ❌ [{i}/{total}] {img_path.name}: {e}")
+        
+        # 等待所有写盘完成，写失败的单独报告
+        outcomes = await asyncio.gather(*pending_writes, return_exceptions=True)
+        for image_name, outcome in zip(pending_writes.values(), outcomes):
+            if isinstance(outcome, Exception):
+                print(f"  ❌ {image_name}: 保存失败 {outcome}")
+    
+    return stats
+
+
 def main():
     parser = argparse.ArgumentParser(description="GLM-4.6V Auto Labeling")
     parser.add_argument("--prefix", type=str, required=True, help="Image prefix (e.g., D1, D2, D4)")
     parser.add_argument("--limit", type=int, default=0, help="Limit number of images (0 = all)")
     parser.add_argument("--images-dir", type=str, default="test_images/extracted_frames", help="Images directory")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max concurrent API requests (default 8)")
+    parser.add_argument("--rpm", type=int, default=0, help="Max requests per minute (0 = unlimited)")
+    parser.add_argument("--max-connections", type=int, default=0,
+                        help="HTTP connection pool size (default: same as --concurrency)")
+    parser.add_argument("--verbose", action="store_true", help="Print every detected object")
     args = parser.parse_args()
     
     if not API_KEY:
@@ -238,7 +572,7 @@ def main():
     
     images_dir = Path(args.images_dir)
     pattern = f"{args.prefix}_*.jpg"
-    images = sorted(list(images_dir.glob(pattern)))
+    images = list_images(images_dir, args.prefix)
     
     if args.limit > 0:
         images = images[:args.limit]
@@ -253,36 +587,16 @@ def main():
     print("=" * 70)
     print(f"🏷️  GLM-4.6V Auto Labeling - {args.prefix} series")
     print(f"   Images: {len(images)} | Resolution: {sample_w}x{sample_h}")
+    print(f"   Concurrency: {args.concurrency}")
     print("=" * 70)
     
-    client = ZaiClient(api_key=API_KEY)
+    client = create_client(API_KEY, args.max_connections or args.concurrency)
     
     output_dir = Path(f"output/{args.prefix.lower()}_annotations")
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    stats = {"pedestrian": 0, "vehicle": 0, "traffic_sign": 0, "construction": 0}
-    
-    for i, img_path in enumerate(images, 1):
-        print(f"\n📷 [{i}/{len(images)}] {img_path.name}")
-        print("-" * 50)
-        
-        try:
-            detections = detect_objects(client, str(img_path))
-            
-            print(f"  ✅ Detected {len(detections)} objects:")
-            for det in detections:
-                cat = det["category"]
-                stats[cat] = stats.get(cat, 0) + 1
-                emoji = {"pedestrian": "🔴", "vehicle": "🟢", "traffic_sign": "🔵", "construction": "🟠"}.get(cat, "⚪")
-                print(f"     {emoji} {det['label']} [{cat}] {det['bbox']}")
-            
-            annotation = to_xanylabeling_format(detections, str(img_path))
-            json_path = output_dir / f"{img_path.stem}.json"
-            with open(json_path, "w", encoding="utf-8") as f:
-                json.dump(annotation, f, ensure_ascii=False, indent=2)
-                
-        except Exception as e:
-            print(f"  ❌ Error: {e}")
+    stats = asyncio.run(label_images(client, images, output_dir, max(1, args.concurrency), args.rpm,
+                                     args.verbose))
     
     print("\n" + "=" * 70)
     print(f"📊 Statistics:")
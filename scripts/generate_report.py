@@ -11,8 +11,59 @@ import json
 import argparse
 from pathlib import Path
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:
+    # 可选依赖：未安装时回退到标准库 json
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+# 并行读取标注文件的线程数（以文件 I/O 为主）
+READ_WORKERS = 16
+
+
+# 标签分组（报告中按此顺序输出）
+LABEL_GROUP_TITLES = ("车辆类", "行人类", "交通标志类", "施工标志类", "其他")
+
+_VEHICLE_LABELS = frozenset({'car', 'van', 'suv', 'truck', 'bus', 'taxi', 'motorcycle', 'bicycle'})
+_PEDESTRIAN_LABELS = frozenset({'pedestrian', 'cyclist', 'child', 'crowd'})
+_SIGN_LABELS = frozenset({'ahead_only', 'turn_right', 'stop', 'no_entry'})
+_SIGN_KEYWORDS = ('sign', 'limit', 'light')
+_CONSTRUCTION_KEYWORDS = ('cone', 'barrier', 'construction')
+
+
+def _label_group(label: str) -> str:
+    """判断标签所属的报告分组"""
+    if label in _VEHICLE_LABELS:
+        return "车辆类"
+    if label in _PEDESTRIAN_LABELS:
+        return "行人类"
+    
+    label_lower = label.lower()
+    if label in _SIGN_LABELS or any(kw in label_lower for kw in _SIGN_KEYWORDS):
+        return "交通标志类"
+    if any(kw in label_lower for kw in _CONSTRUCTION_KEYWORDS):
+        return "施工标志类"
+    return "其他"
+
+
+def _summarize_annotation(json_file: Path) -> tuple:
+    """
+    统计单个标注文件
+    
+    Returns:
+        (标签计数, 类别计数, 目标数)
+    """
+    data = _json_loads(json_file.read_bytes())
+    shapes = data.get('shapes', [])
+    labels = Counter(shape['label'] for shape in shapes)
+    categories = Counter(shape.get('flags', {}).get('category', 'unknown') for shape in shapes)
+    return labels, categories, len(shapes)
+
 
 def generate_report(prefix: str):
     """生成指定数据集的标注总结报告"""
@@ -37,36 +88,19 @@ def generate_report(prefix: str):
     label_counter = Counter()
     category_counter = Counter()
     
-    for jf in json_files:
-        with open(jf) as f:
-            data = json.load(f)
-        shapes = data.get('shapes', [])
-        total_objects += len(shapes)
-        if len(shapes) == 0:
-            empty_frames += 1
-        for shape in shapes:
-            label_counter[shape['label']] += 1
-            category_counter[shape.get('flags', {}).get('category', 'unknown')] += 1
-    
-    # 分类标签
-    vehicles = []
-    pedestrians = []
-    signs = []
-    construction = []
-    others = []
-    
+    # 各文件互相独立，多线程并行读取，再合并部分计数
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as executor:
+        for labels, categories, n_shapes in executor.map(_summarize_annotation, json_files):
+            total_objects += n_shapes
+            if n_shapes == 0:
+                empty_frames += 1
+            label_counter.update(labels)
+            category_counter.update(categories)
+    
+    # 分类标签（单次遍历，按数量降序）
+    groups = {title: [] for title in LABEL_GROUP_TITLES}
     for label, count in label_counter.items():
-        label_lower = label.lower()
-        if label in ['car', 'van', 'suv', 'truck', 'bus', 'taxi', 'motorcycle', 'bicycle']:
-            vehicles.append((label, count))
-        elif label in ['pedestrian', 'cyclist', 'child', 'crowd']:
-            pedestrians.append((label, count))
-        elif 'sign' in label_lower or 'limit' in label_lower or 'light' in label_lower or label in ['ahead_only', 'turn_right', 'stop', 'no_entry']:
-            signs.append((label, count))
-        elif 'cone' in label_lower or 'barrier' in label_lower or 'construction' in label_lower:
-            construction.append((label, count))
-        else:
-            others.append((label, count))
+        groups[_label_group(label)].append((label, count))
     
     # 查找源视频
     video_path = f"raw_data/videos/raw_videos/{prefix}.mp4"
@@ -112,30 +146,11 @@ def generate_report(prefix: str):
     ])
     
     # 各类别详情
-    if vehicles:
-        report_lines.append(f"\n--- 车辆类 ({len(vehicles)} 种) ---")
-        for label, count in sorted(vehicles, key=lambda x: -x[1]):
-            report_lines.append(f"{label:20}: {count}")
-    
-    if pedestrians:
-        report_lines.append(f"\n--- 行人类 ({len(pedestrians)} 种) ---")
-        for label, count in sorted(pedestrians, key=lambda x: -x[1]):
-            report_lines.append(f"{label:20}: {count}")
-    
-    if signs:
-        report_lines.append(f"\n--- 交通标志类 ({len(signs)} 种) ---")
-        for label, count in sorted(signs, key=lambda x: -x[1]):
-            report_lines.append(f"{label:20}: {count}")
-    
-    if construction:
-        report_lines.append(f"\n--- 施工标志类 ({len(construction)} 种) ---")
-        for label, count in sorted(construction, key=lambda x: -x[1]):
-            report_lines.append(f"{label:20}: {count}")
-    
-    if others:
-        report_lines.append(f"\n--- 其他 ({len(others)} 种) ---")
-        for label, count in sorted(others, key=lambda x: -x[1]):
-            report_lines.append(f"{label:20}: {count}")
+    for title, items in groups.items():
+        if items:
+            report_lines.append(f"\n--- {title} ({len(items)} 种) ---")
+            for label, count in sorted(items, key=lambda x: -x[1]):
+                report_lines.append(f"{label:20}: {count}")
     
     report_lines.extend([
         "",
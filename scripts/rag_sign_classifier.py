@@ -13,13 +13,66 @@
 """
 
 import os
+import re
+import mmap
 import base64
+from collections import Counter
+from functools import lru_cache
 from pathlib import Path
 from PIL import Image
 import chromadb
 from chromadb.utils import embedding_functions
 
 
+# 标志类别关键词（按优先级排列，预编译为单个正则以减少逐个子串扫描）
+SIGN_CATEGORY_PATTERNS = [
+    (re.compile(r"speed|limit|km"), "speed_limit"),
+    (re.compile(r"no |prohibit|forbidden"), "prohibition"),
+    (re.compile(r"warn|ahead|danger"), "warning"),
+    (re.compile(r"direct|arrow|way"), "direction"),
+]
+
+
+@lru_cache(maxsize=64)
+def _load_image_data_url(image_path: str, mtime_ns: int) -> str:
+    """
+    读取图片并编码为 Base64 Data URL
+    
+    按 (路径, 修改时间) 缓存，同一张图片多次精排时复用编码结果，
+    文件被修改后自动失效。
+    """
+    # mmap 直接编码，避免额外复制一份文件内容
+    with open(image_path, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        img_data = base64.b64encode(mm).decode("ascii")
+    return f"data:image/png;base64,{img_data}"
+
+
+@lru_cache(maxsize=1024)
+def _build_candidate_prompt(candidates: tuple) -> str:
+    """
+    根据候选列表构建精排提示词
+    
+    Args:
+        candidates: (id, label, category) 三元组构成的 tuple
+    """
+    candidate_list = "\n".join([
+        f"  {i+1}. {label} (类别: {category})"
+        for i, (_, label, category) in enumerate(candidates)
+    ])
+    
+    return f"""请仔细观察这个交通标志图片，从以下候选项中选择最匹配的：
+
+{candidate_list}
+
+规则：
+1. 如果能确定是哪个，请返回对应的标签
+2. 如果都不匹配，返回 "unknown"
+3. 注意观察：颜色、形状、文字、数字、符号
+
+请只返回标签名称，不要其他解释。例如：speed limit 70"""
+
+
 class TrafficSignRAG:
     """交通标志 RAG 检索与分类器"""
     
@@ -45,7 +98,11 @@ class TrafficSignRAG:
         self.client = chromadb.PersistentClient(path=db_path)
         
         # 获取或创建 collection
-        self.collection = self.client.get_or_create_collection(
+        self.collection = self._get_or_create_collection()
+    
+    def _get_or_create_collection(self):
+        """获取或创建交通标志 collection"""
+        return self.client.get_or_create_collection(
             name="traffic_signs",
             embedding_function=self.embedding_fn,
             metadata={"description": "Hong Kong Traffic Signs Database"}
@@ -74,15 +131,13 @@ class TrafficSignRAG:
         existing = self.collection.count()
         if existing > 0:
             print(f"⚠️  清空已有 {existing} 条记录...")
-            # ChromaDB 需要通过 ID 删除
-            all_ids = self.collection.get()["ids"]
-            if all_ids:
-                self.collection.delete(ids=all_ids)
+            # 直接删除并重建 collection，避免逐条取 ID 再删除
+            self.client.delete_collection("traffic_signs")
+            self.collection = self._get_or_create_collection()
         
         # 批量添加
         ids = []
         documents = []
-        images_data = []
         metadatas = []
         
         for i, sign_path in enumerate(sign_files):
@@ -90,10 +145,6 @@ class TrafficSignRAG:
             label = sign_path.stem.replace("_", " ").replace("-", " ")
             normalized_label = sign_path.stem.lower().replace(" ", "_").replace("-", "_")
             
-            # 读取图片并编码为 base64（用于存储）
-            with open(sign_path, "rb") as f:
-                img_data = base64.b64encode(f.read()).decode()
-            
             # 为 CLIP 准备图片描述（用于 embedding）
             # CLIP 可以编码图片或文本，这里用文本描述
             description = f"traffic sign: {label}"
@@ -125,16 +176,10 @@ class TrafficSignRAG:
         """根据标签判断标志类别"""
         label_lower = label.lower()
         
-        if any(k in label_lower for k in ["speed", "limit", "km"]):
-            return "speed_limit"
-        elif any(k in label_lower for k in ["no ", "prohibit", "forbidden"]):
-            return "prohibition"
-        elif any(k in label_lower for k in ["warn", "ahead", "danger"]):
-            return "warning"
-        elif any(k in label_lower for k in ["direct", "arrow", "way"]):
-            return "direction"
-        else:
-            return "other"
+        for pattern, category in SIGN_CATEGORY_PATTERNS:
+            if pattern.search(label_lower):
+                return category
+        return "other"
     
     def search(self, query: str, n_results: int = 5) -> list:
         """
@@ -190,33 +235,20 @@ class TrafficSignRAG:
         Returns:
             分类结果
         """
-        # 读取图片
-        with open(image_path, "rb") as f:
-            img_data = base64.b64encode(f.read()).decode()
+        # 读取图片（缓存编码结果）
+        image_url = _load_image_data_url(image_path, os.stat(image_path).st_mtime_ns)
         
-        # 构建候选列表文本
-        candidate_list = "\n".join([
-            f"  {i+1}. {c['label']} (类别: {c['category']})"
-            for i, c in enumerate(candidates)
-        ])
-        
-        prompt = f"""请仔细观察这个交通标志图片，从以下候选项中选择最匹配的：
-
-{candidate_list}
-
-规则：
-1. 如果能确定是哪个，请返回对应的标签
-2. 如果都不匹配，返回 "unknown"
-3. 注意观察：颜色、形状、文字、数字、符号
-
-请只返回标签名称，不要其他解释。例如：speed limit 70"""
+        # 构建提示词（相同候选列表复用缓存）
+        prompt = _build_candidate_prompt(
+            tuple((c["id"], c["label"], c["category"]) for c in candidates)
+        )
 
         response = client.chat.completions.create(
             model="glm-4.6v",
             messages=[{
                 "role": "user",
                 "content": [
-                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_data}"}},
+                    {"type": "image_url", "image_url": {"url": image_url}},
                     {"type": "text", "text": prompt}
                 ]
             }]
@@ -245,18 +277,15 @@ class TrafficSignRAG:
         """获取数据库统计信息"""
         count = self.collection.count()
         
-        # 获取所有记录
-        all_data = self.collection.get()
+        # 只取元数据，不传输 embedding 和文档
+        all_data = self.collection.get(include=["metadatas"])
         
         # 统计类别
-        categories = {}
-        for meta in all_data["metadatas"]:
-            cat = meta.get("category", "unknown")
-            categories[cat] = categories.get(cat, 0) + 1
+        categories = Counter(meta.get("category", "unknown") for meta in all_data["metadatas"])
         
         return {
             "total_signs": count,
-            "categories": categories
+            "categories": dict(categories)
         }
 
 
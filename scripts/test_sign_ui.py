@@ -18,15 +18,28 @@ import os
 import sys
 import json
 import asyncio
+import threading
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict
+from dataclasses import dataclass, field
+from typing import List, Optional
 
 # 添加项目路径
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from PIL import Image, ImageDraw
 
+try:
+    import orjson
+except ImportError:
+    # 可选依赖：未安装时回退到标准库 json
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
 # ============================================================================
 # 导入核心分类模块
 # ============================================================================
@@ -59,14 +72,14 @@ def crop_and_visualize(image_path: str, bbox: List[int], label: str) -> Image.Im
 
 def get_sign_crop(image_path: str, bbox: List[int]) -> Image.Image:
     """获取放大的标志裁剪"""
-    img = Image.open(image_path)
     padding = 20
-    x1 = max(0, bbox[0] - padding)
-    y1 = max(0, bbox[1] - padding)
-    x2 = min(img.width, bbox[2] + padding)
-    y2 = min(img.height, bbox[3] + padding)
+    with Image.open(image_path) as img:
+        x1 = max(0, bbox[0] - padding)
+        y1 = max(0, bbox[1] - padding)
+        x2 = min(img.width, bbox[2] + padding)
+        y2 = min(img.height, bbox[3] + padding)
+        crop = img.crop((x1, y1, x2, y2))
     
-    crop = img.crop((x1, y1, x2, y2))
     # 放大以便查看
     new_size = (crop.width * 4, crop.height * 4)
     return crop.resize(new_size, Image.Resampling.LANCZOS)
@@ -76,7 +89,25 @@ def get_sign_crop(image_path: str, bbox: List[int]) -> Image.Image:
 # 测试数据加载
 # ============================================================================
 
-def find_test_samples(archive_dir: str, label_filter: str = None, max_samples: int = 20) -> List[Dict]:
+@dataclass(slots=True)
+class SignSample:
+    """一个待测试的交通标志样本"""
+    image: str
+    bbox: tuple  # (x1, y1, x2, y2)
+    old_label: str
+    source: str
+    judgment: Optional[str] = None  # 人眼判断: correct/wrong/uncertain
+    new_prediction: Optional[str] = None
+    # 界面显示用的截断标签，加载时算好
+    label_50: str = field(init=False, repr=False)
+    label_60: str = field(init=False, repr=False)
+    
+    def __post_init__(self):
+        self.label_50 = self.old_label[:50]
+        self.label_60 = self.old_label[:60]
+
+
+def find_test_samples(archive_dir: str, label_filter: str = None, max_samples: int = 20) -> List[SignSample]:
     """从归档数据中查找测试样本"""
     samples = []
     archive_path = Path(archive_dir)
@@ -90,8 +121,7 @@ def find_test_samples(archive_dir: str, label_filter: str = None, max_samples: i
                 continue
             
             for json_path in ann_dir.glob("*.json"):
-                with open(json_path, encoding="utf-8") as f:
-                    data = json.load(f)
+                data = _json_loads(json_path.read_bytes())
                 
                 for shape in data.get("shapes", []):
                     if shape.get("flags", {}).get("category") != "traffic_sign":
@@ -106,14 +136,12 @@ def find_test_samples(archive_dir: str, label_filter: str = None, max_samples: i
                         continue
                     
                     pts = shape["points"]
-                    samples.append({
-                        "image": str(frame_path),
-                        "bbox": [int(pts[0][0]), int(pts[0][1]), int(pts[1][0]), int(pts[1][1])],
-                        "old_label": label,
-                        "source": sub_dir.name,
-                        "judgment": None,  # 人眼判断: correct/wrong/uncertain
-                        "new_prediction": None,
-                    })
+                    samples.append(SignSample(
+                        image=str(frame_path),
+                        bbox=(int(pts[0][0]), int(pts[0][1]), int(pts[1][0]), int(pts[1][1])),
+                        old_label=label,
+                        source=sub_dir.name,
+                    ))
                     
                     if len(samples) >= max_samples:
                         return samples
@@ -121,6 +149,35 @@ def find_test_samples(archive_dir: str, label_filter: str = None, max_samples: i
     return samples
 
 
+@dataclass
+class UIState:
+    """界面状态：已加载样本、当前下标、标记为错误的样本下标"""
+    samples: List[SignSample] = field(default_factory=list)
+    idx: int = 0
+    wrong_indices: List[int] = field(default_factory=list)  # 保持有序，供 bisect 查找
+    
+    @property
+    def current(self) -> SignSample:
+        return self.samples[self.idx]
+    
+    def reset(self, samples: List[SignSample]) -> None:
+        self.samples = samples
+        self.idx = 0
+        self.wrong_indices.clear()
+    
+    def set_judgment(self, judgment: str) -> None:
+        """记录当前样本的判断，同步维护错误样本下标"""
+        idx = self.idx
+        self.samples[idx].judgment = judgment
+        
+        pos = bisect_left(self.wrong_indices, idx)
+        is_listed = pos < len(self.wrong_indices) and self.wrong_indices[pos] == idx
+        if judgment == "wrong" and not is_listed:
+            self.wrong_indices.insert(pos, idx)
+        elif judgment != "wrong" and is_listed:
+            del self.wrong_indices[pos]
+
+
 # ============================================================================
 # Gradio UI v2
 # ============================================================================
@@ -139,67 +196,79 @@ def create_ui():
     
     # 状态变量
     archive_dir = "dataset_output/archive/v1_188signs_20241217"
-    test_samples = []
-    current_idx = [0]
+    state = UIState()
     
     # 核心分类器实例（复用，避免重复创建）
     classifier = SignClassifierV2(api_key=api_key)
     
+    # 常驻事件循环（后台线程），分类器内部的 httpx.AsyncClient 绑定在这个循环上，
+    # 多次点击之间复用连接
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="sign-ui-loop", daemon=True).start()
+    
+    # 来回翻页时复用已渲染的图片（bbox 转为 tuple 作为缓存键）
+    @lru_cache(maxsize=128)
+    def cached_visualize(image_path: str, bbox: tuple, label: str):
+        return crop_and_visualize(image_path, list(bbox), label)
+    
+    @lru_cache(maxsize=128)
+    def cached_crop(image_path: str, bbox: tuple):
+        return get_sign_crop(image_path, list(bbox))
+    
     # ========== 核心函数 ==========
     
     def load_samples(label_filter: str, max_count: int):
-        nonlocal test_samples
         filter_val = label_filter if label_filter != "全部" else None
-        test_samples = find_test_samples(archive_dir, filter_val, int(max_count))
-        current_idx[0] = 0
-        if test_samples:
+        state.reset(find_test_samples(archive_dir, filter_val, int(max_count)))
+        cached_visualize.cache_clear()
+        cached_crop.cache_clear()
+        if state.samples:
             return (
-                f"✅ 加载 {len(test_samples)} 个样本",
+                f"✅ 加载 {len(state.samples)} 个样本",
                 *show_current(),
                 get_stats_text()
             )
         return ("❌ 没有找到样本", None, None, "", "", "", get_stats_text())
     
     def show_current():
-        if not test_samples:
+        if not state.samples:
             return None, None, "", "", ""
         
-        sample = test_samples[current_idx[0]]
-        full_img = crop_and_visualize(sample["image"], sample["bbox"], sample["old_label"])
-        crop_img = get_sign_crop(sample["image"], sample["bbox"])
+        sample = state.current
+        full_img = cached_visualize(sample.image, sample.bbox, sample.old_label)
+        crop_img = cached_crop(sample.image, sample.bbox)
         
         # 判断状态显示
-        judgment = sample.get("judgment")
-        judgment_icon = {"correct": "✅", "wrong": "❌", "uncertain": "❓"}.get(judgment, "⚪")
+        judgment_icon = {"correct": "✅", "wrong": "❌", "uncertain": "❓"}.get(sample.judgment, "⚪")
         
-        info = f"📍 样本 {current_idx[0] + 1}/{len(test_samples)} {judgment_icon}\n"
-        info += f"📁 来源: {sample['source']}\n"
-        info += f"🏷️ 旧标签: {sample['old_label'][:50]}..."
+        info = f"📍 样本 {state.idx + 1}/{len(state.samples)} {judgment_icon}\n"
+        info += f"📁 来源: {sample.source}\n"
+        info += f"🏷️ 旧标签: {sample.label_50}..."
         
         # 如果有新预测，显示对比
         result = ""
-        if sample.get("new_prediction"):
-            result = f"🔮 新预测: {sample['new_prediction']}\n"
-            result += f"🏷️ 旧标签: {sample['old_label'][:50]}..."
+        if sample.new_prediction:
+            result = f"🔮 新预测: {sample.new_prediction}\n"
+            result += f"🏷️ 旧标签: {sample.label_50}..."
         
-        return full_img, crop_img, info, sample["old_label"], result
+        return full_img, crop_img, info, sample.old_label, result
     
     def next_sample():
-        if test_samples:
-            current_idx[0] = (current_idx[0] + 1) % len(test_samples)
+        if state.samples:
+            state.idx = (state.idx + 1) % len(state.samples)
         return (*show_current(), get_stats_text())
     
     def prev_sample():
-        if test_samples:
-            current_idx[0] = (current_idx[0] - 1) % len(test_samples)
+        if state.samples:
+            state.idx = (state.idx - 1) % len(state.samples)
         return (*show_current(), get_stats_text())
     
     def run_classification(use_shuffle: bool, custom_prompt: str):
         """使用核心模块进行分类"""
-        if not test_samples or not api_key:
+        if not state.samples or not api_key:
             return "❌ 没有样本或 API Key 未设置", ""
         
-        sample = test_samples[current_idx[0]]
+        sample = state.current
         
         # 更新分类器配置
         classifier.use_shuffle = use_shuffle
@@ -208,24 +277,21 @@ def create_ui():
         else:
             classifier.set_prompt(DEFAULT_CLASSIFY_PROMPT)
         
-        # 运行异步分类（使用核心模块）
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        predicted, description, debug = loop.run_until_complete(
-            classifier.classify(sample["image"], sample["bbox"])
-        )
-        loop.close()
+        # 运行异步分类（使用核心模块，提交到常驻事件循环）
+        predicted, description, debug = asyncio.run_coroutine_threadsafe(
+            classifier.classify(sample.image, list(sample.bbox)), loop
+        ).result()
         
         # 保存预测结果
-        sample["new_prediction"] = predicted
+        sample.new_prediction = predicted
         
         result = f"🔮 新预测: {predicted}\n\n"
         result += f"📝 模型描述:\n{description}\n\n"
-        result += f"🏷️ 旧标签: {sample['old_label'][:60]}...\n\n"
+        result += f"🏷️ 旧标签: {sample.label_60}...\n\n"
         
         if predicted == "other":
             result += "ℹ️ 分类为 other（导航/方向/倒计时等）"
-        elif predicted == sample['old_label']:
+        elif predicted == sample.old_label:
             result += "✅ 与旧标签一致"
         else:
             result += "⚠️ 与旧标签不同"
@@ -235,31 +301,31 @@ def create_ui():
     # ========== 人眼标注 ==========
     
     def mark_correct():
-        if test_samples:
-            test_samples[current_idx[0]]["judgment"] = "correct"
+        if state.samples:
+            state.set_judgment("correct")
         return (*next_sample(),)
     
     def mark_wrong():
-        if test_samples:
-            test_samples[current_idx[0]]["judgment"] = "wrong"
+        if state.samples:
+            state.set_judgment("wrong")
         return (*next_sample(),)
     
     def mark_uncertain():
-        if test_samples:
-            test_samples[current_idx[0]]["judgment"] = "uncertain"
+        if state.samples:
+            state.set_judgment("uncertain")
         return (*next_sample(),)
     
     # ========== 统计 ==========
     
     def get_stats_text():
-        if not test_samples:
+        if not state.samples:
             return "📊 统计: 暂无数据"
         
-        total = len(test_samples)
-        tested = sum(1 for s in test_samples if s.get("new_prediction"))
-        correct = sum(1 for s in test_samples if s.get("judgment") == "correct")
-        wrong = sum(1 for s in test_samples if s.get("judgment") == "wrong")
-        uncertain = sum(1 for s in test_samples if s.get("judgment") == "uncertain")
+        total = len(state.samples)
+        judgments = Counter(s.judgment for s in state.samples)
+        correct = judgments["correct"]
+        wrong = judgments["wrong"]
+        uncertain = judgments["uncertain"]
         
         accuracy = (correct / (correct + wrong) * 100) if (correct + wrong) > 0 else 0
         
@@ -270,30 +336,31 @@ def create_ui():
     # ========== 导出 ==========
     
     def export_results():
-        if not test_samples:
+        if not state.samples:
             return "❌ 没有数据可导出"
         
         export_data = {
             "export_time": datetime.now().isoformat(),
-            "total_samples": len(test_samples),
+            "total_samples": len(state.samples),
             "prompt_used": classifier.prompt_template,
             "core_module": "glm_labeling.core.sign_classifier_v2",
             "results": []
         }
         
-        for s in test_samples:
+        for s in state.samples:
             export_data["results"].append({
-                "image": s["image"],
-                "bbox": s["bbox"],
-                "old_label": s["old_label"],
-                "new_prediction": s.get("new_prediction"),
-                "judgment": s.get("judgment"),
-                "source": s["source"]
+                "image": s.image,
+                "bbox": list(s.bbox),
+                "old_label": s.old_label,
+                "new_prediction": s.new_prediction,
+                "judgment": s.judgment,
+                "source": s.source
             })
         
         # 统计
-        correct = sum(1 for s in test_samples if s.get("judgment") == "correct")
-        wrong = sum(1 for s in test_samples if s.get("judgment") == "wrong")
+        judgments = Counter(s.judgment for s in state.samples)
+        correct = judgments["correct"]
+        wrong = judgments["wrong"]
         export_data["stats"] = {
             "correct": correct,
             "wrong": wrong,
@@ -303,35 +370,36 @@ def create_ui():
         # 保存
         output_path = f"tests/test_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         os.makedirs("tests", exist_ok=True)
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(export_data, f, ensure_ascii=False, indent=2)
+        if orjson is not None:
+            Path(output_path).write_bytes(orjson.dumps(export_data, option=orjson.OPT_INDENT_2))
+        else:
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump(export_data, f, ensure_ascii=False, indent=2)
         
         return f"✅ 已导出到 {output_path}"
     
     # ========== 只看错误 ==========
     
     def show_only_wrong():
-        if not test_samples:
+        if not state.samples:
             return "❌ 没有数据", None, None, "", "", "", get_stats_text()
         
         # 找第一个标记为错误的
-        for i, s in enumerate(test_samples):
-            if s.get("judgment") == "wrong":
-                current_idx[0] = i
-                return (f"🔍 显示第 {i+1} 个错误样本", *show_current(), get_stats_text())
+        if state.wrong_indices:
+            i = state.wrong_indices[0]
+            state.idx = i
+            return (f"🔍 显示第 {i+1} 个错误样本", *show_current(), get_stats_text())
         
         return ("ℹ️ 没有标记为错误的样本", *show_current(), get_stats_text())
     
     def next_wrong():
-        if not test_samples:
+        if not state.samples:
             return (*show_current(), get_stats_text())
         
-        start = current_idx[0]
-        for i in range(1, len(test_samples)):
-            idx = (start + i) % len(test_samples)
-            if test_samples[idx].get("judgment") == "wrong":
-                current_idx[0] = idx
-                break
+        # 当前位置之后的第一个错误样本，没有则回绕到开头
+        if state.wrong_indices:
+            pos = bisect_right(state.wrong_indices, state.idx)
+            state.idx = state.wrong_indices[pos % len(state.wrong_indices)]
         
         return (*show_current(), get_stats_text())
     
@@ -9,9 +9,16 @@
     python3 two_stage_classifier.py --test test_images/extracted_frames/D1_frame_0006.jpg --bbox "733,270,776,300"
 """
 
+import io
 import os
-import base64
 import re
+import math
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from PIL import Image
 from zai import ZaiClient
@@ -130,65 +137,178 @@ SIGN_TYPES = {
 }
 
 
-def classify_sign_two_stage(client: ZaiClient, image_path: str, bbox: list = None) -> dict:
+# 裁剪图 JPEG 编码质量
+CROP_JPEG_QUALITY = 90
+# 缩小解码时裁剪图最长边的下限（像素）
+CROP_MIN_DECODE_SIZE = 512
+
+# 推测执行的阶段2类型（数据集中最常见的是指示/方向标志）
+SPECULATIVE_SIGN_TYPE = "4"
+
+# 最近分类结果缓存（按裁剪图内容哈希，重复帧上的同一标志直接复用）
+RESULT_CACHE_SIZE = 256
+_result_cache = OrderedDict()
+_result_cache_lock = threading.Lock()
+
+# 回复解析用的正则（模块加载时编译）
+_RE_TYPE = re.compile(r'[1-5]')
+_RE_DETAIL = re.compile(r'[1-8]')
+_RE_DIGITS = re.compile(r'\d+')
+
+TYPE_PROMPT = """请判断这是什么类型的交通标志：
+1. 限速标志（红圈白底，中间有数字）
+2. 禁止标志（红圈，禁止某种行为）
+3. 警告标志（三角形或其他形状，提示危险）
+4. 指示/方向标志（蓝色或绿色，指示方向或信息）
+5. 其他/无法确定
+
+只返回数字（1-5）。"""
+
+
+@lru_cache(maxsize=4)
+def get_client(api_key: str) -> ZaiClient:
+    """
+    获取共享的 ZaiClient（按 api_key 缓存）
+    
+    底层是线程安全的 httpx.Client，批量调用时各线程共用 keep-alive 连接。
+    """
+    return ZaiClient(api_key=api_key)
+
+
+def _ask(client: ZaiClient, image_url: str, prompt: str) -> str:
+    """发送单张图片 + 文本提示，返回模型回复"""
+    response = client.chat.completions.create(
+        model="glm-4.6v",
+        messages=[{
+            "role": "user",
+            "content": [
+                {"type": "image_url", "image_url": {"url": image_url}},
+                {"type": "text", "text": prompt}
+            ]
+        }],
+        temperature=0.1
+    )
+    return response.choices[0].message.content.strip()
+
+
+def _parse_detail(sign_type: str, sign_info: dict, detail_response: str) -> dict:
+    """解析阶段2回复，无法解析时返回 None"""
+    if sign_type == "1":  # 限速
+        number = _RE_DIGITS.search(detail_response)
+        if number:
+            speed_value = number.group()
+            print(f"    阶段2 - 限速数字: {speed_value}")
+            return {
+                "success": True,
+                "label": sign_info["label_format"].format(speed_value),
+                "type": sign_info["name"],
+                "detail": speed_value
+            }
+    else:
+        # 使用 label_map
+        label_map = sign_info.get("label_map", {})
+        detail_match = _RE_DETAIL.search(detail_response)
+        if detail_match and detail_match.group() in label_map:
+            label = label_map[detail_match.group()]
+            print(f"    阶段2 - 具体类型: {label}")
+            return {
+                "success": True,
+                "label": label,
+                "type": sign_info["name"],
+                "detail": detail_response
+            }
+    return None
+
+
+def _cache_get(key: bytes):
+    with _result_cache_lock:
+        result = _result_cache.get(key)
+        if result is not None:
+            _result_cache.move_to_end(key)
+        return result
+
+
+def _cache_put(key: bytes, result: dict) -> None:
+    with _result_cache_lock:
+        _result_cache[key] = result
+        _result_cache.move_to_end(key)
+        if len(_result_cache) > RESULT_CACHE_SIZE:
+            _result_cache.popitem(last=False)
+
+
+def classify_sign_two_stage(client: ZaiClient, image_path: str, bbox: list = None,
+                            speculate: bool = False) -> dict:
     """
     两阶段交通标志分类
     
+    speculate=True 时，阶段1 发出的同时推测性地对最常见类型（SPECULATIVE_SIGN_TYPE）
+    发起阶段2，猜中时阶段2的延迟被阶段1掩盖；猜错时再按实际类型补发一次。
+    代价：每个标志都多发一次请求，类型不是 SPECULATIVE_SIGN_TYPE 时该请求作废
+    （已发出的请求无法取消），API 调用量最多翻倍，限流时不建议开启。
+    推测请求失败时按正常流程重新请求阶段2。
+    
     Args:
         client: ZaiClient 实例
         image_path: 图片路径
         bbox: 标志区域 [x1, y1, x2, y2]
+        speculate: 是否推测执行阶段2（默认关闭）
     
     Returns:
         分类结果字典
     """
-    # 加载并裁剪图片
-    img = Image.open(image_path).convert("RGB")
-    
-    if bbox:
-        padding = 10
-        x1 = max(0, bbox[0] - padding)
-        y1 = max(0, bbox[1] - padding)
-        x2 = min(img.width, bbox[2] + padding)
-        y2 = min(img.height, bbox[3] + padding)
-        img = img.crop((x1, y1, x2, y2))
+    # 加载并裁剪图片（先裁剪再转 RGB，整帧解码结果用完即释放）
+    with Image.open(image_path) as frame:
+        if bbox:
+            padding = 10
+            
+            # 裁剪区域很大时按 JPEG draft 模式缩小解码（非 JPEG 时为空操作），
+            # 缩小后最长边仍不低于 CROP_MIN_DECODE_SIZE；bbox 同比缩放
+            edge = max(bbox[2] - bbox[0], bbox[3] - bbox[1]) + 2 * padding
+            target = CROP_MIN_DECODE_SIZE / max(edge, 1)
+            if target <= 0.5:
+                full_width = frame.width
+                frame.draft("RGB", (math.ceil(frame.width * target), math.ceil(frame.height * target)))
+                scale = frame.width / full_width
+                if scale != 1:
+                    bbox = [v * scale for v in bbox]
+                    padding *= scale
+            
+            x1 = max(0, bbox[0] - padding)
+            y1 = max(0, bbox[1] - padding)
+            x2 = min(frame.width, bbox[2] + padding)
+            y2 = min(frame.height, bbox[3] + padding)
+            region = frame.crop((x1, y1, x2, y2))
+        else:
+            region = frame
+        img = region.convert("RGB")
     
-    # 保存裁剪图
-    temp_path = "/tmp/sign_crop_2stage.jpg"
-    img.save(temp_path, "JPEG")
+    # 内存中编码裁剪图，两个阶段共用同一份 Data URL
+    with img, io.BytesIO() as buf:
+        img.save(buf, "JPEG", quality=CROP_JPEG_QUALITY)
+        jpeg_bytes = buf.getvalue()
     
-    with open(temp_path, "rb") as f:
-        img_data = base64.b64encode(f.read()).decode()
+    cache_key = hashlib.blake2b(jpeg_bytes, digest_size=16).digest()
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return dict(cached)
     
-    # ========================================
-    # 阶段1：判断标志类型
-    # ========================================
-    type_prompt = """请判断这是什么类型的交通标志：
-1. 限速标志（红圈白底，中间有数字）
-2. 禁止标志（红圈，禁止某种行为）
-3. 警告标志（三角形或其他形状，提示危险）
-4. 指示/方向标志（蓝色或绿色，指示方向或信息）
-5. 其他/无法确定
-
-只返回数字（1-5）。"""
+    image_url = f"data:image/jpeg;base64,{base64.b64encode(jpeg_bytes).decode()}"
     
+    executor = ThreadPoolExecutor(max_workers=1) if speculate else None
     try:
-        response1 = client.chat.completions.create(
-            model="glm-4.6v",
-            messages=[{
-                "role": "user",
-                "content": [
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_data}"}},
-                    {"type": "text", "text": type_prompt}
-                ]
-            }],
-            temperature=0.1
-        )
+        speculative = None
+        if executor is not None:
+            speculative = executor.submit(
+                _ask, client, image_url, SIGN_TYPES[SPECULATIVE_SIGN_TYPE]["detail_prompt"]
+            )
         
-        type_response = response1.choices[0].message.content.strip()
+        # ========================================
+        # 阶段1：判断标志类型
+        # ========================================
+        type_response = _ask(client, image_url, TYPE_PROMPT)
         
         # 提取类型数字
-        type_match = re.search(r'[1-5]', type_response)
+        type_match = _RE_TYPE.search(type_response)
         if not type_match:
             return {
                 "success": False,
@@ -205,57 +325,29 @@ def classify_sign_two_stage(client: ZaiClient, image_path: str, bbox: list = Non
         # ========================================
         # 阶段2：识别具体细节
         # ========================================
+        result = None
         if sign_info.get("requires_detail", False):
-            detail_prompt = sign_info["detail_prompt"]
+            detail_response = None
+            if speculative is not None and sign_type == SPECULATIVE_SIGN_TYPE:
+                try:
+                    detail_response = speculative.result()
+                except Exception as e:
+                    print(f"    ⚠️ 推测请求失败，重新请求阶段2: {e}")
+            if detail_response is None:
+                detail_response = _ask(client, image_url, sign_info["detail_prompt"])
             
-            response2 = client.chat.completions.create(
-                model="glm-4.6v",
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_data}"}},
-                        {"type": "text", "text": detail_prompt}
-                    ]
-                }],
-                temperature=0.1
-            )
-            
-            detail_response = response2.choices[0].message.content.strip()
-            
-            # 根据标志类型处理细节
-            if sign_type == "1":  # 限速
-                numbers = re.findall(r'\d+', detail_response)
-                if numbers:
-                    speed_value = numbers[0]
-                    label = sign_info["label_format"].format(speed_value)
-                    print(f"    阶段2 - 限速数字: {speed_value}")
-                    return {
-                        "success": True,
-                        "label": label,
-                        "type": sign_info["name"],
-                        "detail": speed_value
-                    }
-            else:
-                # 使用 label_map
-                label_map = sign_info.get("label_map", {})
-                detail_match = re.search(r'[1-8]', detail_response)
-                if detail_match and detail_match.group() in label_map:
-                    label = label_map[detail_match.group()]
-                    print(f"    阶段2 - 具体类型: {label}")
-                    return {
-                        "success": True,
-                        "label": label,
-                        "type": sign_info["name"],
-                        "detail": detail_response
-                    }
+            result = _parse_detail(sign_type, sign_info, detail_response)
         
         # 无需详细分类或分类失败
-        label = sign_info.get("label", f"traffic_sign_{sign_info['name']}")
-        return {
-            "success": True,
-            "label": label,
-            "type": sign_info["name"]
-        }
+        if result is None:
+            result = {
+                "success": True,
+                "label": sign_info.get("label", f"traffic_sign_{sign_info['name']}"),
+                "type": sign_info["name"]
+            }
+        
+        _cache_put(cache_key, result)
+        return dict(result)
     
     except Exception as e:
         print(f"    ⚠️ 分类失败: {e}")
@@ -264,6 +356,10 @@ def classify_sign_two_stage(client: ZaiClient, image_path: str, bbox: list = Non
             "label": "traffic_sign",
             "error": str(e)
         }
+    finally:
+        # 不等待未用上的推测请求
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
 
 
 def main():
@@ -272,6 +368,8 @@ def main():
     parser = argparse.ArgumentParser(description="两阶段交通标志分类器")
     parser.add_argument("--test", type=str, required=True, help="测试图片路径")
     parser.add_argument("--bbox", type=str, help="裁剪区域 x1,y1,x2,y2")
+    parser.add_argument("--speculate", action="store_true",
+                        help="与阶段1并行推测执行阶段2（更快，但每个标志多一次 API 调用）")
     args = parser.parse_args()
     
     api_key = os.getenv("ZAI_API_KEY")
@@ -279,7 +377,7 @@ def main():
         print("❌ 请设置 ZAI_API_KEY")
         return
     
-    client = ZaiClient(api_key=api_key)
+    client = get_client(api_key)
     
     print("=" * 60)
     print("🔍 两阶段交通标志分类")
@@ -294,7 +392,7 @@ def main():
     
     print("\n⏳ 分类中...")
     
-    result = classify_sign_two_stage(client, args.test, bbox)
+    result = classify_sign_two_stage(client, args.test, bbox, speculate=args.speculate)
     
     print("\n" + "-" * 40)
     print("📊 分类结果:")
@@ -14,21 +14,49 @@
 """
 
 import os
+import re
+import errno
 import sys
 import json
+import heapq
 import argparse
 import subprocess
 import time
+import shutil
+import zipfile
+import threading
+import asyncio
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from PIL import Image
+
+try:
+    import orjson
+except ImportError:
+    # 可选依赖：未安装时回退到标准库 json
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+try:
+    import cv2
+except ImportError:
+    # 可选依赖：未安装时可视化回退到 PIL
+    cv2 = None
+
+try:
+    import ahocorasick
+except ImportError:
+    # 可选依赖：未安装时场景事件回退到单个预编译正则
+    ahocorasick = None
+
 # 添加 scripts 目录到路径
 sys.path.insert(0, str(Path(__file__).parent))
 
 from auto_labeling_parallel import (
-    process_single_image,
-    to_xanylabeling_format,
-    get_image_size
+    process_images_async,
+    to_xanylabeling_format
 )
 
 
@@ -46,14 +74,76 @@ COLORS = {
     'traffic_sign': (0, 100, 255),
     'construction': (255, 165, 0),
 }
+DEFAULT_COLOR = (128, 128, 128)
+
+# OpenCV 使用 BGR 顺序，预先转换好
+_COLORS_BGR = {cat: color[::-1] for cat, color in COLORS.items()}
+
+
+def write_json(path: Path, data: dict, indent: bool = True) -> None:
+    """
+    写出 JSON（有 orjson 时走 orjson，输出 UTF-8）
+    
+    indent=False 时输出紧凑格式，用于只给程序读取的逐帧标注文件。
+    """
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 if indent else 0
+        Path(path).write_bytes(orjson.dumps(data, option=option))
+    elif indent:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
 
 
 # ============================================================================
 # Step 1: 抽帧
 # ============================================================================
 
+# 从 ffmpeg 管道读取的块大小
+PIPE_READ_SIZE = 1 << 20
+# ffmpeg 超时（秒）
+FFMPEG_TIMEOUT = 300
+
+_JPEG_SOI = b"\xff\xd8"
+_JPEG_EOI = b"\xff\xd9"
+
+
+def iter_mjpeg_frames(stream):
+    """
+    按 SOI/EOI 标记把 MJPEG 字节流切分为单帧 JPEG
+    
+    熵编码数据中的 0xFF 都会被填充为 FF 00，且 ffmpeg 输出不带 EXIF 缩略图，
+    因此帧内不会出现 FF D9。
+    """
+    buf = bytearray()
+    search_from = 0
+    while True:
+        chunk = stream.read(PIPE_READ_SIZE)
+        if not chunk:
+            return
+        buf += chunk
+        
+        while True:
+            end = buf.find(_JPEG_EOI, search_from)
+            if end < 0:
+                # 下一块可能以 D9 开头，回退一个字节再找
+                search_from = max(0, len(buf) - 1)
+                break
+            start = max(buf.find(_JPEG_SOI, 0, end), 0)
+            yield bytes(buf[start:end + 2])
+            del buf[:end + 2]
+            search_from = 0
+
+
 def extract_frames(video_name: str, fps: int = 3) -> tuple:
-    """从视频抽帧"""
+    """
+    从视频抽帧
+    
+    ffmpeg 以 MJPEG 输出到管道，按帧边界切分后原样写盘，
+    不再依赖 ffmpeg 自己按文件名模板逐帧打开/关闭输出文件。
+    """
     video_path = VIDEO_DIR / f"{video_name}.mp4"
     
     if not video_path.exists():
@@ -71,45 +161,209 @@ def extract_frames(video_name: str, fps: int = 3) -> tuple:
     print(f"\n📹 Step 1: 抽帧 ({fps} FPS)")
     print(f"   视频: {video_path}")
     
-    # 使用 ffmpeg 抽帧
-    output_pattern = str(frames_dir / f"{video_name}_%06d.jpg")
+    # 使用 ffmpeg 抽帧，MJPEG 输出到 stdout
     cmd = [
-        "ffmpeg", "-i", str(video_path),
+        "ffmpeg", "-loglevel", "error", "-nostats",
+        "-i", str(video_path),
         "-vf", f"fps={fps}",
         "-q:v", "2",  # 高质量
-        output_pattern,
-        "-y"  # 覆盖
+        "-f", "image2pipe", "-vcodec", "mjpeg",
+        "-"
     ]
     
     try:
-        result = subprocess.run(
-            cmd, 
-            capture_output=True, 
-            text=True,
-            timeout=300  # 5分钟超时
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=PIPE_READ_SIZE
         )
-        
-        frame_count = len(list(frames_dir.glob("*.jpg")))
-        print(f"   ✅ 抽取 {frame_count} 帧")
-        
-        return frames_dir, frame_count
-        
-    except subprocess.TimeoutExpired:
-        print("   ❌ ffmpeg 超时")
-        return None, 0
     except Exception as e:
         print(f"   ❌ ffmpeg 错误: {e}")
         return None, 0
+    
+    # 5分钟超时：到时直接结束 ffmpeg，读取循环随之结束
+    timed_out = threading.Event()
+    
+    def on_timeout():
+        timed_out.set()
+        proc.kill()
+    
+    timer = threading.Timer(FFMPEG_TIMEOUT, on_timeout)
+    timer.start()
+    
+    frame_count = 0
+    try:
+        for frame_count, jpeg in enumerate(iter_mjpeg_frames(proc.stdout), start=1):
+            (frames_dir / f"{video_name}_{frame_count:06d}.jpg").write_bytes(jpeg)
+        proc.wait()
+    except Exception as e:
+        proc.kill()
+        print(f"   ❌ 抽帧错误: {e}")
+        return None, 0
+    finally:
+        timer.cancel()
+        proc.stdout.close()
+    
+    if timed_out.is_set():
+        print("   ❌ ffmpeg 超时")
+        return None, 0
+    
+    print(f"   ✅ 抽取 {frame_count} 帧")
+    return frames_dir, frame_count
 
 
 # ============================================================================
 # Step 2: 自动标注
 # ============================================================================
 
-def run_labeling(frames_dir: Path, video_name: str, workers: int, use_rag: bool) -> Path:
-    """运行自动标注"""
+# dHash 边长（哈希共 DHASH_SIZE² 位）
+DHASH_SIZE = 16
+# 与代表帧的汉明距离不超过该值视为近似重复
+DEDUP_THRESHOLD = 4
+
+
+def compute_dhash(image_path: str, hash_size: int = DHASH_SIZE) -> int:
+    """
+    计算差值哈希 dHash
+    
+    缩放为 (hash_size + 1) × hash_size 的灰度图，逐行比较相邻像素亮度；
+    JPEG 用 draft 在解码阶段缩小，不解出全分辨率像素。
+    """
+    with Image.open(image_path) as img:
+        img.draft("L", (hash_size * 8, hash_size * 8))
+        pixels = img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR).tobytes()
+    
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(offset, offset + hash_size):
+            bits = (bits << 1) | (pixels[col] < pixels[col + 1])
+    return bits
+
+
+def _try_dhash(image_path: str):
+    """计算 dHash，帧损坏或无法解码时返回 None（该帧单独成组，交给标注步骤报告错误）"""
+    try:
+        return compute_dhash(image_path)
+    except Exception:
+        return None
+
+
+def group_similar_frames(image_paths: list, threshold: int = DEDUP_THRESHOLD) -> tuple:
+    """
+    按 dHash 把连续的近似重复帧归组（3 FPS 下相邻帧往往几乎相同）
+    
+    按时间顺序遍历，与当前代表帧的汉明距离不超过 threshold 的帧并入该组，
+    否则成为新的代表帧。只有代表帧需要请求 API。
+    无法计算哈希的帧总是单独作为代表帧，不会并入或吸收其他帧。
+    
+    Returns:
+        (representatives, members)：members 为 {代表路径: [并入该组的其他路径]}
+    """
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        hashes = list(executor.map(_try_dhash, image_paths))
+    
+    representatives = []
+    members = {}
+    rep_hash = None
+    for image_path, frame_hash in zip(image_paths, hashes):
+        if (frame_hash is not None and rep_hash is not None
+                and (frame_hash ^ rep_hash).bit_count() <= threshold):
+            members.setdefault(representatives[-1], []).append(image_path)
+        else:
+            representatives.append(image_path)
+            rep_hash = frame_hash
+    
+    return representatives, members
+
+
+async def _label_frames(image_paths: list, output_dir: Path, api_key: str, workers: int,
+                        use_rag: bool, batch_size: int, vis_dir: Path,
+                        members: dict = None) -> tuple:
+    """
+    异步标注所有帧，按完成顺序逐帧写出标注（及可视化）
+    
+    members: {代表帧: [近似重复帧]}，代表帧的检测结果同时写给组内各帧
+    
+    Returns:
+        (stats, success, errors)
+    """
+    members = members or {}
+    stats = {"pedestrian": 0, "vehicle": 0, "traffic_sign": 0, "construction": 0}
+    success = 0
+    errors = 0
+    total = len(image_paths) + sum(map(len, members.values()))
+    
+    results = process_images_async(image_paths, api_key, workers, use_rag,
+                                   batch_size=batch_size)
+    
+    # 可视化绘制放到独立线程池，不阻塞事件循环
+    vis_futures = {}
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as vis_executor:
+        i = 0
+        async for result_path, detections, error, image_size in results:
+            # 同一视频的帧尺寸相同，代表帧的尺寸直接用于组内各帧
+            # 结果同时分发给组内的近似重复帧
+            for image_path in [result_path, *members.get(result_path, ())]:
+                i += 1
+                try:
+                    if error:
+                        print(f"  ⚠️ [{i}/{total}] {error}")
+                        errors += 1
+                    else:
+                        for det in detections:
+                            cat = det.get("category", "unknown")
+                            stats[cat] = stats.get(cat, 0) + 1
+                        
+                        # 保存
+                        annotation = to_xanylabeling_format(detections, image_path, image_size)
+                        out_path = output_dir / f"{Path(image_path).stem}.json"
+                        write_json(out_path, annotation, indent=False)
+                        
+                        if vis_dir is not None:
+                            future = vis_executor.submit(
+                                _draw_visualization, Path(image_path), annotation["shapes"],
+                                vis_dir / f"{out_path.stem}_vis.jpg"
+                            )
+                            vis_futures[future] = Path(image_path).name
+                        
+                        emoji = "✅" if detections else "⚪"
+                        print(f"  {emoji} [{i}/{total}] {len(detections)} objects")
+                        success += 1
+                        
+                except Exception as e:
+                    print(f"  ❌ [{i}/{total}] {e}")
+                    errors += 1
+    
+    # 线程池已退出，所有绘制均已结束；失败的帧逐个报告（标注本身已保存）
+    vis_errors = 0
+    for future, image_name in vis_futures.items():
+        exc = future.exception()
+        if exc is not None:
+            print(f"  ❌ {image_name}: 可视化失败 {exc}")
+            vis_errors += 1
+    if vis_errors:
+        print(f"   ⚠️ 可视化失败: {vis_errors} 帧（稍后的可视化步骤会重试）")
+    
+    return stats, success, errors
+
+
+def run_labeling(frames_dir: Path, video_name: str, workers: int, use_rag: bool,
+                 batch_size: int = 1, vis_dir: Path = None, dedup: bool = True) -> Path:
+    """
+    运行自动标注（batch_size > 1 时每个请求携带多帧）
+    
+    请求走 asyncio：Semaphore 限制在途请求数，所有请求共享一个连接池，
+    并发数不再受线程数限制。
+    
+    传入 vis_dir 时，每帧标注写出后立即用内存中的 shapes 绘制可视化，
+    后续 generate_visualizations 只需补齐缺失的帧，不再重新解析 JSON。
+    
+    dedup 为 True 时近似重复的连续帧只标注代表帧，结果复制给组内其他帧。
+    """
     print(f"\n🏷️ Step 2: 自动标注")
-    print(f"   Workers: {workers} | RAG: {'✅' if use_rag else '❌'}")
+    print(f"   Workers: {workers} | RAG: {'✅' if use_rag else '❌'} | Batch: {batch_size}")
     
     api_key = os.getenv("ZAI_API_KEY")
     if not api_key:
@@ -126,47 +380,23 @@ def run_labeling(frames_dir: Path, video_name: str, workers: int, use_rag: bool)
     rag_suffix = "_rag" if use_rag else ""
     output_dir = OUTPUT_BASE / f"{video_name.lower()}_annotations{rag_suffix}"
     output_dir.mkdir(parents=True, exist_ok=True)
-    
-    # 准备任务
-    task_args = [(str(img), api_key, 3, use_rag) for img in image_files]
+    if vis_dir is not None:
+        vis_dir.mkdir(parents=True, exist_ok=True)
     
     start_time = time.time()
-    stats = {"pedestrian": 0, "vehicle": 0, "traffic_sign": 0, "construction": 0}
-    success = 0
-    errors = 0
     
-    # 并行处理
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        futures = {executor.submit(process_single_image, arg): arg[0] for arg in task_args}
-        
-        for i, future in enumerate(as_completed(futures)):
-            image_path = futures[future]
-            image_name = Path(image_path).name
-            
-            try:
-                _, detections, error = future.result()
-                
-                if error:
-                    print(f"  ⚠️ [{i+1}/{len(image_files)}] {error}")
-                    errors += 1
-                else:
-                    for det in detections:
-                        cat = det.get("category", "unknown")
-                        stats[cat] = stats.get(cat, 0) + 1
-                    
-                    # 保存
-                    annotation = to_xanylabeling_format(detections, image_path)
-                    out_path = output_dir / f"{Path(image_path).stem}.json"
-                    with open(out_path, "w", encoding="utf-8") as f:
-                        json.dump(annotation, f, ensure_ascii=False, indent=2)
-                    
-                    emoji = "✅" if detections else "⚪"
-                    print(f"  {emoji} [{i+1}/{len(image_files)}] {len(detections)} objects")
-                    success += 1
-                    
-            except Exception as e:
-                print(f"  ❌ [{i+1}/{len(image_files)}] {e}")
-                errors += 1
+    image_paths = [str(img) for img in image_files]
+    members = {}
+    if dedup:
+        image_paths, members = group_similar_frames(image_paths)
+        if members:
+            skipped = len(image_files) - len(image_paths)
+            print(f"   ♻️ {skipped} 帧与相邻帧近似重复，复用代表帧的标注结果")
+    
+    stats, success, errors = asyncio.run(_label_frames(
+        image_paths, output_dir, api_key,
+        workers, use_rag, batch_size, vis_dir, members
+    ))
     
     elapsed = time.time() - start_time
     print(f"\n   📊 统计: {stats}")
@@ -180,35 +410,64 @@ def run_labeling(frames_dir: Path, video_name: str, workers: int, use_rag: bool)
 # Step 3: 可视化
 # ============================================================================
 
-def generate_visualizations(frames_dir: Path, annotations_dir: Path, video_name: str) -> Path:
-    """生成可视化图片"""
-    from PIL import Image, ImageDraw
+VIS_JPEG_QUALITY = 90
+
+
+def _draw_shapes_cv2(frame_path: Path, shapes: list, out_path: Path) -> bool:
+    """
+    用 OpenCV 画框并写出（标签文字仅支持 ASCII）
+    
+    Returns:
+        cv2 无法读取或写出该帧时返回 False，由调用方回退到 PIL
+    """
+    img = cv2.imread(str(frame_path))
+    if img is None:
+        return False
+    
+    for shape in shapes:
+        pts = shape["points"]
+        cat = shape.get("flags", {}).get("category", "unknown")
+        label = shape["label"]
+        
+        color = _COLORS_BGR.get(cat, DEFAULT_COLOR)
+        x1, y1 = int(pts[0][0]), int(pts[0][1])
+        x2, y2 = int(pts[1][0]), int(pts[1][1])
+        cv2.rectangle(img, (x1, y1), (x2, y2), color, 3)
+        
+        # 标签
+        short_label = label[:20] + "..." if len(label) > 20 else label
+        cv2.putText(img, short_label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.5, color, 1, cv2.LINE_AA)
     
-    print(f"\n🎨 Step 3: 生成可视化")
+    return cv2.imwrite(str(out_path), img, [cv2.IMWRITE_JPEG_QUALITY, VIS_JPEG_QUALITY])
+
+
+def visualization_dir(video_name: str) -> Path:
+    """可视化输出目录"""
+    return OUTPUT_BASE / f"{video_name.lower()}_visualized"
+
+
+def _draw_visualization(frame_path: Path, shapes: list, out_path: Path):
+    """按已有的 shapes 绘制一帧（没有检测框时直接复制原图，不解码像素）"""
+    from PIL import ImageDraw
     
-    vis_dir = OUTPUT_BASE / f"{video_name.lower()}_visualized"
-    vis_dir.mkdir(parents=True, exist_ok=True)
+    if not shapes:
+        shutil.copyfile(frame_path, out_path)
+        return
     
-    count = 0
-    for json_path in sorted(annotations_dir.glob("*.json")):
-        frame_name = json_path.stem + ".jpg"
-        frame_path = frames_dir / frame_name
-        
-        if not frame_path.exists():
-            continue
-        
-        img = Image.open(frame_path)
+    # cv2.imread 读不了的帧（路径编码、格式等）返回 None，此时回退到 PIL
+    if cv2 is not None and _draw_shapes_cv2(frame_path, shapes, out_path):
+        return
+    
+    with Image.open(frame_path) as img:
         draw = ImageDraw.Draw(img)
         
-        with open(json_path) as f:
-            data = json.load(f)
-        
-        for shape in data.get("shapes", []):
+        for shape in shapes:
             pts = shape["points"]
             cat = shape.get("flags", {}).get("category", "unknown")
             label = shape["label"]
             
-            color = COLORS.get(cat, (128, 128, 128))
+            color = COLORS.get(cat, DEFAULT_COLOR)
             draw.rectangle([pts[0][0], pts[0][1], pts[1][0], pts[1][1]], 
                           outline=color, width=3)
             
@@ -216,12 +475,65 @@ def generate_visualizations(frames_dir: Path, annotations_dir: Path, video_name:
             short_label = label[:20] + "..." if len(label) > 20 else label
             draw.text((pts[0][0], pts[0][1] - 15), short_label, fill=color)
         
-        out_path = vis_dir / f"{json_path.stem}_vis.jpg"
         img.save(out_path)
-        count += 1
+
+
+def _render_visualization(json_path: Path, frames_dir: Path, vis_dir: Path) -> bool:
+    """
+    从标注文件绘制单帧可视化图片
+    
+    输出比标注和原帧都新时跳过（增量重跑，标注阶段已融合绘制的帧也在此跳过）。
+    
+    Returns:
+        对应帧存在并已输出时返回 True
+    """
+    frame_path = frames_dir / (json_path.stem + ".jpg")
+    try:
+        frame_mtime = frame_path.stat().st_mtime
+    except FileNotFoundError:
+        return False
+    
+    out_path = vis_dir / f"{json_path.stem}_vis.jpg"
+    try:
+        if out_path.stat().st_mtime >= max(json_path.stat().st_mtime, frame_mtime):
+            return True
+    except FileNotFoundError:
+        pass
+    
+    data = _json_loads(json_path.read_bytes())
+    _draw_visualization(frame_path, data.get("shapes", []), out_path)
+    return True
+
+
+def generate_visualizations(frames_dir: Path, annotations_dir: Path, video_name: str,
+                            workers: int = None, json_paths: list = None) -> Path:
+    """
+    生成可视化图片（多线程，OpenCV / PIL 解码编码均会释放 GIL）
+    
+    json_paths: 已列出的标注文件（调用方已遍历过目录时传入，避免重复 glob）
+    """
+    print(f"\n🎨 Step 3: 生成可视化")
+    
+    vis_dir = visualization_dir(video_name)
+    vis_dir.mkdir(parents=True, exist_ok=True)
+    
+    if json_paths is None:
+        json_paths = sorted(annotations_dir.glob("*.json"))
+    
+    count = 0
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [
+            executor.submit(_render_visualization, json_path, frames_dir, vis_dir)
+            for json_path in json_paths
+        ]
         
-        if count % 50 == 0:
-            print(f"   已处理 {count} 张...")
+        for future in as_completed(futures):
+            if not future.result():
+                continue
+            count += 1
+            
+            if count % 50 == 0:
+                print(f"   已处理 {count} 张...")
     
     print(f"   ✅ 生成 {count} 张可视化图片")
     return vis_dir
@@ -231,68 +543,99 @@ def generate_visualizations(frames_dir: Path, annotations_dir: Path, video_name:
 # Step 4: 打包 Dataset
 # ============================================================================
 
-def generate_summary(annotations_dir: Path, video_name: str, frame_count: int, fps: int) -> dict:
-    """分析标注数据并生成统计信息"""
-    from collections import defaultdict
+# 场景事件关键词（标签小写后做子串匹配）
+SCENE_EVENT_KEYWORDS = {
+    "braking": ["brake", "braking", "刹车"],
+    "turn_left": ["turn_left", "left_turn", "左转"],
+    "turn_right": ["turn_right", "right_turn", "右转"],
+    "hazard_lights": ["hazard", "emergency", "双闪"],
+    "pedestrian_crossing": ["crossing", "过马路"],
+}
+
+_KEYWORD_TO_EVENT = {
+    kw: event for event, keywords in SCENE_EVENT_KEYWORDS.items() for kw in keywords
+}
+
+
+def _build_scene_event_matcher():
+    """
+    把全部场景事件关键词编译成一个匹配器，每个标签只扫描一遍
+    
+    有 pyahocorasick 时用 Aho-Corasick 自动机；否则用单个正则，
+    零宽前瞻保证重叠的关键词（如 left_turn_right）也都能命中。
+    
+    Returns:
+        label_lower -> 命中事件集合 的函数
+    """
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for kw, event in _KEYWORD_TO_EVENT.items():
+            automaton.add_word(kw, event)
+        automaton.make_automaton()
+        return lambda text: {event for _, event in automaton.iter(text)}
+    
+    pattern = re.compile(
+        "(?=(" + "|".join(map(re.escape, _KEYWORD_TO_EVENT)) + "))"
+    )
+    return lambda text: {_KEYWORD_TO_EVENT[kw] for kw in pattern.findall(text)}
+
+
+_match_scene_events = _build_scene_event_matcher()
+
+
+def generate_summary(annotations_dir: Path, video_name: str, frame_count: int, fps: int,
+                     json_paths: list = None) -> dict:
+    """
+    分析标注数据并生成统计信息
+    
+    json_paths: 已列出的标注文件（调用方已遍历过目录时传入，避免重复 glob）
+    """
+    from collections import Counter, defaultdict
     from datetime import datetime
     
     stats = {
         "total_frames": frame_count,
         "annotated_frames": 0,
         "total_objects": 0,
-        "categories": defaultdict(int),
-        "subcategories": defaultdict(int),
+        "categories": Counter(),
+        "subcategories": Counter(),
         "scene_events": defaultdict(list),  # 场景事件（刹车、转向等）
         "frame_details": []
     }
     
     # 遍历所有标注文件
-    for json_path in sorted(annotations_dir.glob("*.json")):
+    if json_paths is None:
+        json_paths = annotations_dir.glob("*.json")
+    
+    for json_path in sorted(json_paths):
         frame_name = json_path.stem
         
-        with open(json_path, encoding="utf-8") as f:
-            data = json.load(f)
+        data = _json_loads(json_path.read_bytes())
         
         shapes = data.get("shapes", [])
         if shapes:
             stats["annotated_frames"] += 1
         
+        # 每帧一次性收集类别与标签，用 Counter.update 批量计数
+        categories = [shape.get("flags", {}).get("category", "unknown") for shape in shapes]
+        labels = [shape.get("label", "") for shape in shapes]
+        
+        stats["total_objects"] += len(shapes)
+        stats["categories"].update(categories)
+        stats["subcategories"].update(filter(None, labels))
+        
+        # 检测场景事件
+        for label in labels:
+            for event in _match_scene_events(label.lower()):
+                stats["scene_events"][event].append(frame_name)
+        
         frame_info = {
             "frame": frame_name,
             "objects": len(shapes),
-            "categories": defaultdict(int),
-            "labels": []
+            "categories": Counter(categories),
+            "labels": labels
         }
         
-        for shape in shapes:
-            stats["total_objects"] += 1
-            
-            # 主类别
-            category = shape.get("flags", {}).get("category", "unknown")
-            stats["categories"][category] += 1
-            frame_info["categories"][category] += 1
-            
-            # 标签（细分类别）
-            label = shape.get("label", "")
-            frame_info["labels"].append(label)
-            
-            # 统计子类别
-            if label:
-                stats["subcategories"][label] += 1
-            
-            # 检测场景事件
-            label_lower = label.lower()
-            if any(kw in label_lower for kw in ["brake", "braking", "刹车"]):
-                stats["scene_events"]["braking"].append(frame_name)
-            if any(kw in label_lower for kw in ["turn_left", "left_turn", "左转"]):
-                stats["scene_events"]["turn_left"].append(frame_name)
-            if any(kw in label_lower for kw in ["turn_right", "right_turn", "右转"]):
-                stats["scene_events"]["turn_right"].append(frame_name)
-            if any(kw in label_lower for kw in ["hazard", "emergency", "双闪"]):
-                stats["scene_events"]["hazard_lights"].append(frame_name)
-            if any(kw in label_lower for kw in ["crossing", "过马路"]):
-                stats["scene_events"]["pedestrian_crossing"].append(frame_name)
-        
         stats["frame_details"].append(frame_info)
     
     return stats
@@ -340,7 +683,7 @@ def create_summary_markdown(stats: dict, video_name: str, fps: int, use_rag: boo
         lines.append("")
         lines.append(f"| 标签 | 数量 |")
         lines.append(f"|------|------|")
-        for label, count in sorted(stats['subcategories'].items(), key=lambda x: -x[1])[:20]:
+        for label, count in heapq.nlargest(20, stats['subcategories'].items(), key=lambda x: x[1]):
             # 截断过长的标签
             display_label = label[:50] + "..." if len(label) > 50 else label
             lines.append(f"| {display_label} | {count} |")
@@ -381,7 +724,9 @@ def create_summary_markdown(stats: dict, video_name: str, fps: int, use_rag: boo
     
     shown = 0
     for frame_info in stats['frame_details']:
-        if frame_info['objects'] > 0 and shown < 50:
+        if shown >= 50:
+            break  # 已满 50 帧，不再遍历剩余帧
+        if frame_info['objects'] > 0:
             cats = frame_info['categories']
             lines.append(f"| {frame_info['frame']} | {frame_info['objects']} | "
                         f"{cats.get('pedestrian', 0)} | {cats.get('vehicle', 0)} | "
@@ -398,11 +743,41 @@ def create_summary_markdown(stats: dict, video_name: str, fps: int, use_rag: boo
     return "\n".join(lines)
 
 
+# 打包 Dataset 时并行复制文件的线程数
+COPY_WORKERS = 32
+# 压缩包中不再压缩、直接存储的文件类型
+STORED_SUFFIXES = frozenset({".jpg", ".jpeg", ".png", ".mp4"})
+# 总是复制、不做硬链接的文件类型：标注会在 X-AnyLabeling 中原地修改，不能与源文件共享
+COPIED_SUFFIXES = frozenset({".json"})
+# 硬链接失败时可回退为复制的错误：跨设备、文件系统不支持、链接数达到上限
+LINK_FALLBACK_ERRNOS = frozenset({errno.EXDEV, errno.EPERM, errno.EMLINK})
+
+
+def link_or_copy(src: Path, dst: Path, link: bool = True) -> None:
+    """
+    硬链接到目标位置（同一文件系统内只改元数据，不复制数据）
+    
+    link=False，或跨设备、文件系统不支持硬链接时复制；其他错误照常抛出。
+    """
+    dst = Path(dst)
+    dst.unlink(missing_ok=True)  # 重跑时目标已存在（可能是指向源文件的硬链接，必须先断开）
+    if link:
+        try:
+            os.link(src, dst)
+            return
+        except OSError as e:
+            if e.errno not in LINK_FALLBACK_ERRNOS:
+                raise
+    shutil.copyfile(src, dst)
+
+
 def create_dataset(video_name: str, frames_dir: Path, annotations_dir: Path, vis_dir: Path, 
-                   fps: int = 3, use_rag: bool = False) -> Path:
-    """创建 Dataset 文件夹"""
-    import shutil
+                   fps: int = 3, use_rag: bool = False, ann_files: list = None) -> Path:
+    """
+    创建 Dataset 文件夹
     
+    ann_files: 已列出的标注文件（调用方已遍历过目录时传入，避免重复 glob）
+    """
     print(f"\n📦 Step 4: 创建 Dataset")
     
     # 输出到 dataset_output 目录下
@@ -416,32 +791,38 @@ def create_dataset(video_name: str, frames_dir: Path, annotations_dir: Path, vis
     (dataset_dir / "annotations").mkdir(parents=True, exist_ok=True)
     (dataset_dir / "visualized").mkdir(parents=True, exist_ok=True)
     
-    # 复制视频
+    # 收集所有 (源, 目标) 对，统一并行复制（大量小文件时重叠各自的系统调用延迟）
     video_src = VIDEO_DIR / f"{video_name}.mp4"
-    if video_src.exists():
-        shutil.copy(video_src, dataset_dir / "video" / f"{video_name}.mp4")
+    has_video = video_src.exists()
+    frames = list(frames_dir.glob("*.jpg"))
+    anns = ann_files if ann_files is not None else sorted(annotations_dir.glob("*.json"))
+    viss = list(vis_dir.glob("*.jpg")) if vis_dir and vis_dir.exists() else None
+    
+    pairs = [(frame, dataset_dir / "frames" / frame.name) for frame in frames]
+    pairs += [(ann, dataset_dir / "annotations" / ann.name) for ann in anns]
+    if viss is not None:
+        pairs += [(vis, dataset_dir / "visualized" / vis.name) for vis in viss]
+    if has_video:
+        pairs.append((video_src, dataset_dir / "video" / f"{video_name}.mp4"))
+    
+    with ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+        for _ in executor.map(
+            lambda pair: link_or_copy(*pair, link=pair[0].suffix.lower() not in COPIED_SUFFIXES),
+            pairs
+        ):
+            pass
+    
+    frame_count = len(frames)
+    if has_video:
         print(f"   ✅ 复制视频")
-    
-    # 复制帧
-    frame_count = len(list(frames_dir.glob('*.jpg')))
-    for frame in frames_dir.glob("*.jpg"):
-        shutil.copy(frame, dataset_dir / "frames" / frame.name)
     print(f"   ✅ 复制 {frame_count} 帧")
-    
-    # 复制标注
-    for ann in annotations_dir.glob("*.json"):
-        shutil.copy(ann, dataset_dir / "annotations" / ann.name)
-    print(f"   ✅ 复制 {len(list(annotations_dir.glob('*.json')))} 标注")
-    
-    # 复制可视化
-    if vis_dir and vis_dir.exists():
-        for vis in vis_dir.glob("*.jpg"):
-            shutil.copy(vis, dataset_dir / "visualized" / vis.name)
-        print(f"   ✅ 复制 {len(list(vis_dir.glob('*.jpg')))} 可视化")
+    print(f"   ✅ 复制 {len(anns)} 标注")
+    if viss is not None:
+        print(f"   ✅ 复制 {len(viss)} 可视化")
     
     # 生成总结文档
     print(f"   📝 生成标注总结文档...")
-    stats = generate_summary(annotations_dir, video_name, frame_count, fps)
+    stats = generate_summary(annotations_dir, video_name, frame_count, fps, anns)
     summary_md = create_summary_markdown(stats, video_name, fps, use_rag)
     
     summary_path = dataset_dir / "SUMMARY.md"
@@ -462,14 +843,19 @@ def create_dataset(video_name: str, frames_dir: Path, annotations_dir: Path, vis
         "use_rag": use_rag
     }
     stats_path = dataset_dir / "stats.json"
-    with open(stats_path, "w", encoding="utf-8") as f:
-        json.dump(stats_json, f, ensure_ascii=False, indent=2)
+    write_json(stats_path, stats_json)
     print(f"   ✅ 生成 stats.json")
     
     # 生成压缩包（放在 dataset_output 目录下）
     print(f"   📦 创建压缩包...")
     zip_path = output_base / f"{video_name}_dataset.zip"
-    shutil.make_archive(str(dataset_dir), 'zip', str(output_base), f"{video_name}_dataset")
+    archive_files = [dst for _, dst in pairs] + [summary_path, stats_path]
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        for path in archive_files:
+            # JPEG / MP4 已经是压缩格式，直接存储；JSON / Markdown 才压缩
+            compress_type = (zipfile.ZIP_STORED if path.suffix.lower() in STORED_SUFFIXES
+                             else zipfile.ZIP_DEFLATED)
+            zf.write(path, path.relative_to(output_base), compress_type=compress_type)
     zip_size = zip_path.stat().st_size / (1024 * 1024)
     print(f"   ✅ {zip_path} ({zip_size:.1f} MB)")
     
@@ -484,8 +870,12 @@ def main():
     parser = argparse.ArgumentParser(description="视频到数据集一键流水线")
     parser.add_argument("--video", type=str, required=True, help="视频名称 (如 D3, D4)")
     parser.add_argument("--fps", type=int, default=3, help="抽帧率 (默认 3)")
-    parser.add_argument("--workers", type=int, default=20, help="并行线程数 (默认 20)")
+    parser.add_argument("--workers", type=int, default=20, help="并发请求数 (默认 20)")
     parser.add_argument("--rag", action="store_true", help="启用 RAG 细粒度分类")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="每个请求携带的帧数 (默认 1，建议 4-8)")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="禁用近似重复帧去重（默认按 dHash 只标注代表帧）")
     parser.add_argument("--skip-extract", action="store_true", help="跳过抽帧步骤")
     parser.add_argument("--skip-visualize", action="store_true", help="跳过可视化步骤")
     args = parser.parse_args()
@@ -508,21 +898,29 @@ def main():
         if not frames_dir:
             return
     
-    # Step 2: 标注
-    annotations_dir = run_labeling(frames_dir, video_name, args.workers, args.rag)
+    # Step 2: 标注（未跳过可视化时同步绘制）
+    fused_vis_dir = None if args.skip_visualize else visualization_dir(video_name)
+    annotations_dir = run_labeling(frames_dir, video_name, args.workers, args.rag,
+                                   max(1, args.batch_size), vis_dir=fused_vis_dir,
+                                   dedup=not args.no_dedup)
     if not annotations_dir:
         return
     
+    # 标注文件只列一次，可视化与打包共用
+    ann_files = sorted(annotations_dir.glob("*.json"))
+    
     # Step 3: 可视化
     if args.skip_visualize:
         vis_dir = None
         print(f"\n⏭️ 跳过可视化")
     else:
-        vis_dir = generate_visualizations(frames_dir, annotations_dir, video_name)
+        # 标注阶段已绘制的帧会按 mtime 跳过，这里只补齐缺失的帧
+        vis_dir = generate_visualizations(frames_dir, annotations_dir, video_name,
+                                          json_paths=ann_files)
     
     # Step 4: 打包
     dataset_dir = create_dataset(video_name, frames_dir, annotations_dir, vis_dir, 
-                                  fps=args.fps, use_rag=args.rag)
+                                  fps=args.fps, use_rag=args.rag, ann_files=ann_files)
     
     # 完成
     total_time = time.time() - start_time
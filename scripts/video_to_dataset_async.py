@@ -10,18 +10,36 @@
 
 import os
 import sys
+import errno
 import json
+import heapq
 import argparse
 import subprocess
 import time
 import asyncio
 import base64
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 
 import httpx
 from PIL import Image
 
+try:
+    import h2  # noqa: F401  仅用于检测 httpx 能否启用 HTTP/2
+    HTTP2_ENABLED = True
+except ImportError:
+    # 可选依赖：未安装时连接池走 HTTP/1.1
+    HTTP2_ENABLED = False
+
+try:
+    import orjson
+except ImportError:
+    # 可选依赖：未安装时回退到标准库 json
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
 # 添加项目路径
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
@@ -119,6 +137,15 @@ def image_to_base64_url(image_path: str) -> str:
     return f"data:image/{mime_type};base64,{data}"
 
 
+def write_json(path: Path, data: dict) -> None:
+    """写出 JSON（有 orjson 时一次序列化为 bytes 直接写盘，输出 UTF-8 + 2 空格缩进）"""
+    if orjson is not None:
+        Path(path).write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
 def get_image_size(image_path: str) -> tuple:
     """获取图片尺寸"""
     with Image.open(image_path) as img:
@@ -136,9 +163,14 @@ def convert_coords(bbox: List[int], width: int, height: int) -> List[int]:
     ]
 
 
-def to_xanylabeling_format(detections: List[Dict], image_path: str) -> Dict:
-    """转换为 X-AnyLabeling 格式"""
-    width, height = get_image_size(image_path)
+def to_xanylabeling_format(detections: List[Dict], image_path: str, image_size: tuple = None) -> Dict:
+    """
+    转换为 X-AnyLabeling 格式
+    
+    Args:
+        image_size: 已知的 (width, height)，提供时不再读取图片
+    """
+    width, height = image_size or get_image_size(image_path)
     
     shapes = []
     for det in detections:
@@ -165,23 +197,31 @@ def to_xanylabeling_format(detections: List[Dict], image_path: str) -> Dict:
 # ============================================================================
 
 class AsyncDetector:
-    """异步目标检测器"""
+    """
+    异步目标检测器
+    
+    整个流水线共用一个 httpx.AsyncClient：连接池大小与并发数一致，
+    安装 h2 时启用 HTTP/2，多个请求复用同一条 TLS 连接。
+    """
     
     def __init__(self, api_key: str, max_concurrent: int = 12, timeout: float = 45.0):
         self.api_key = api_key
         self.timeout = timeout
+        self.max_concurrent = max_concurrent
         self.semaphore = asyncio.Semaphore(max_concurrent)
         self.client: Optional[httpx.AsyncClient] = None
     
     async def __aenter__(self):
         self.client = httpx.AsyncClient(
             base_url=API_BASE_URL,
+            http2=HTTP2_ENABLED,
             timeout=httpx.Timeout(self.timeout, connect=10.0),
             headers={
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json"
             },
-            limits=httpx.Limits(max_connections=30, max_keepalive_connections=15)
+            limits=httpx.Limits(max_connections=self.max_concurrent,
+                                max_keepalive_connections=self.max_concurrent)
         )
         return self
     
@@ -194,7 +234,7 @@ class AsyncDetector:
         异步检测单张图片
         
         Returns:
-            (detections, error)
+            (detections, image_size, error)：image_size 为 (width, height)
         """
         async with self.semaphore:  # 控制并发
             return await self._detect_with_retry(image_path, retry)
@@ -204,11 +244,13 @@ class AsyncDetector:
         image_name = Path(image_path).name
         last_error = None
         
+        # 编码与尺寸只取一次，重试和后续写标注都复用
+        base64_url = image_to_base64_url(image_path)
+        image_size = get_image_size(image_path)
+        width, height = image_size
+        
         for attempt in range(max_retry):
             try:
-                base64_url = image_to_base64_url(image_path)
-                width, height = get_image_size(image_path)
-                
                 payload = {
                     "model": MODEL_NAME,
                     "messages": [{
@@ -241,7 +283,7 @@ class AsyncDetector:
                     continue
                 
                 if not detections:
-                    return [], None
+                    return [], image_size, None
                 
                 # 后处理
                 processed = []
@@ -262,7 +304,7 @@ class AsyncDetector:
                         "bbox": bbox
                     })
                 
-                return processed, None
+                return processed, image_size, None
                 
             except httpx.TimeoutException:
                 last_error = "Timeout"
@@ -274,7 +316,7 @@ class AsyncDetector:
                 else:
                     await asyncio.sleep(2)
         
-        return [], last_error
+        return [], image_size, last_error
     
     async def classify_sign_rag(self, image_path: str, bbox: list) -> str:
         """
@@ -434,7 +476,8 @@ def extract_frames(video_path: str, output_name: str, dataset_dir: Path, fps: in
     
     output_pattern = str(frames_dir / f"{output_name}_%06d.jpg")
     cmd = [
-        "ffmpeg", "-i", str(video_path),
+        "ffmpeg", "-loglevel", "error", "-nostats",
+        "-i", str(video_path),
         "-vf", f"fps={fps}",
         "-q:v", "2",
         output_pattern,
@@ -442,7 +485,8 @@ def extract_frames(video_path: str, output_name: str, dataset_dir: Path, fps: in
     ]
     
     try:
-        subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        # 不缓冲 ffmpeg 日志，帧数直接从输出目录统计
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=300)
         frame_count = len(list(frames_dir.glob("*.jpg")))
         print(f"   ✅ 抽取 {frame_count} 帧")
         return frames_dir, frame_count
@@ -546,7 +590,7 @@ async def detect_and_save(
     use_rag: bool = True
 ) -> tuple:
     """检测并保存结果"""
-    detections, error = await detector.detect(image_path)
+    detections, image_size, error = await detector.detect(image_path)
     
     if error:
         return (0, error)
@@ -565,10 +609,9 @@ async def detect_and_save(
             stats[cat] += 1
     
     # 保存
-    annotation = to_xanylabeling_format(detections, image_path)
+    annotation = to_xanylabeling_format(detections, image_path, image_size)
     out_path = output_dir / f"{Path(image_path).stem}.json"
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(annotation, f, ensure_ascii=False, indent=2)
+    write_json(out_path, annotation)
     
     return (len(detections), None)
 
@@ -577,29 +620,19 @@ async def detect_and_save(
 # Step 3: 可视化
 # ============================================================================
 
-def generate_visualizations(frames_dir: Path, annotations_dir: Path, dataset_dir: Path) -> Path:
-    """生成可视化图片，直接输出到 dataset 目录"""
+def _render_visualization(json_path: Path, frames_dir: Path, vis_dir: Path) -> bool:
+    """绘制单帧可视化图片，对应帧不存在时返回 False"""
     from PIL import ImageDraw
     
-    print(f"\n🎨 Step 3: 生成可视化")
+    frame_path = frames_dir / (json_path.stem + ".jpg")
+    if not frame_path.exists():
+        return False
     
-    vis_dir = dataset_dir / "visualized"
-    vis_dir.mkdir(parents=True, exist_ok=True)
+    data = _json_loads(json_path.read_bytes())
     
-    count = 0
-    for json_path in sorted(annotations_dir.glob("*.json")):
-        frame_name = json_path.stem + ".jpg"
-        frame_path = frames_dir / frame_name
-        
-        if not frame_path.exists():
-            continue
-        
-        img = Image.open(frame_path)
+    with Image.open(frame_path) as img:
         draw = ImageDraw.Draw(img)
         
-        with open(json_path) as f:
-            data = json.load(f)
-        
         for shape in data.get("shapes", []):
             pts = shape["points"]
             cat = shape.get("flags", {}).get("category", "unknown")
@@ -612,12 +645,39 @@ def generate_visualizations(frames_dir: Path, annotations_dir: Path, dataset_dir
             short_label = label[:20] + "..." if len(label) > 20 else label
             draw.text((pts[0][0], pts[0][1] - 15), short_label, fill=color)
         
-        out_path = vis_dir / f"{json_path.stem}_vis.jpg"
-        img.save(out_path)
-        count += 1
+        img.save(vis_dir / f"{json_path.stem}_vis.jpg")
+    return True
+
+
+def generate_visualizations(frames_dir: Path, annotations_dir: Path, dataset_dir: Path,
+                            json_paths: list = None) -> Path:
+    """
+    生成可视化图片，直接输出到 dataset 目录（多线程，PIL 解码/编码时释放 GIL）
+    
+    json_paths: 已列出的标注文件（调用方已遍历过目录时传入，避免重复 glob）
+    """
+    print(f"\n🎨 Step 3: 生成可视化")
+    
+    vis_dir = dataset_dir / "visualized"
+    vis_dir.mkdir(parents=True, exist_ok=True)
+    
+    if json_paths is None:
+        json_paths = sorted(annotations_dir.glob("*.json"))
+    
+    count = 0
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = [
+            executor.submit(_render_visualization, json_path, frames_dir, vis_dir)
+            for json_path in json_paths
+        ]
         
-        if count % 50 == 0:
-            print(f"   已处理 {count} 张...")
+        for future in as_completed(futures):
+            if not future.result():
+                continue
+            count += 1
+            
+            if count % 50 == 0:
+                print(f"   已处理 {count} 张...")
     
     print(f"   ✅ 生成 {count} 张可视化图片")
     return vis_dir
@@ -627,33 +687,36 @@ def generate_visualizations(frames_dir: Path, annotations_dir: Path, dataset_dir
 # Step 4: 打包 Dataset
 # ============================================================================
 
-def generate_summary(annotations_dir: Path, video_name: str, frame_count: int) -> dict:
-    """分析标注数据并生成统计信息"""
-    from collections import defaultdict
+def generate_summary(annotations_dir: Path, video_name: str, frame_count: int,
+                     json_paths: list = None) -> dict:
+    """
+    分析标注数据并生成统计信息
+    
+    json_paths: 已列出的标注文件（调用方已遍历过目录时传入，避免重复 glob）
+    """
+    from collections import Counter
     
     stats = {
         "total_frames": frame_count,
         "annotated_frames": 0,
         "total_objects": 0,
-        "categories": defaultdict(int),
-        "subcategories": defaultdict(int),
+        "categories": Counter(),
+        "subcategories": Counter(),
     }
     
-    for json_path in sorted(annotations_dir.glob("*.json")):
-        with open(json_path, encoding="utf-8") as f:
-            data = json.load(f)
+    if json_paths is None:
+        json_paths = annotations_dir.glob("*.json")
+    
+    for json_path in sorted(json_paths):
+        data = _json_loads(json_path.read_bytes())
         
         shapes = data.get("shapes", [])
         if shapes:
             stats["annotated_frames"] += 1
         
-        for shape in shapes:
-            stats["total_objects"] += 1
-            category = shape.get("flags", {}).get("category", "unknown")
-            stats["categories"][category] += 1
-            label = shape.get("label", "")
-            if label:
-                stats["subcategories"][label] += 1
+        stats["total_objects"] += len(shapes)
+        stats["categories"].update(shape.get("flags", {}).get("category", "unknown") for shape in shapes)
+        stats["subcategories"].update(filter(None, (shape.get("label", "") for shape in shapes)))
     
     return stats
 
@@ -701,7 +764,7 @@ def create_summary_markdown(stats: dict, video_name: str, fps: int, elapsed_time
         lines.append("")
         lines.append(f"| 标签 | 数量 |")
         lines.append(f"|------|------|")
-        for label, count in sorted(stats['subcategories'].items(), key=lambda x: -x[1])[:20]:
+        for label, count in heapq.nlargest(20, stats['subcategories'].items(), key=lambda x: x[1]):
             display_label = label[:50] + "..." if len(label) > 50 else label
             lines.append(f"| {display_label} | {count} |")
         lines.append("")
@@ -712,8 +775,13 @@ def create_summary_markdown(stats: dict, video_name: str, fps: int, elapsed_time
     return "\n".join(lines)
 
 
-def finalize_dataset(video_name: str, video_path: str, dataset_dir: Path, fps: int = 3, elapsed_time: float = None) -> Path:
-    """生成报告并完成 Dataset（文件已直接生成到目录，无需复制）"""
+def finalize_dataset(video_name: str, video_path: str, dataset_dir: Path, fps: int = 3, elapsed_time: float = None,
+                     ann_files: list = None) -> Path:
+    """
+    生成报告并完成 Dataset（文件已直接生成到目录，无需复制）
+    
+    ann_files: 已列出的标注文件（调用方已遍历过目录时传入，避免重复 glob）
+    """
     import shutil
     
     print(f"\n📦 Step 4: 完成 Dataset")
@@ -724,7 +792,13 @@ def finalize_dataset(video_name: str, video_path: str, dataset_dir: Path, fps: i
     video_src = Path(video_path)
     video_dest = video_subdir / video_src.name
     if video_src.exists() and not video_dest.exists():
-        shutil.copy(video_src, video_dest)
+        # 同一文件系统内用硬链接，不复制数据；跨设备时回退为复制
+        try:
+            os.link(video_src, video_dest)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            shutil.copyfile(video_src, video_dest)
         print(f"   ✅ 复制视频")
     
     # 统计已有文件
@@ -733,14 +807,18 @@ def finalize_dataset(video_name: str, video_path: str, dataset_dir: Path, fps: i
     vis_dir = dataset_dir / "visualized"
     
     frame_count = len(list(frames_dir.glob("*.jpg"))) if frames_dir.exists() else 0
-    ann_count = len(list(annotations_dir.glob("*.json"))) if annotations_dir.exists() else 0
+    if ann_files is not None:
+        anns = ann_files
+    else:
+        anns = sorted(annotations_dir.glob("*.json")) if annotations_dir.exists() else []
+    ann_count = len(anns)
     vis_count = len(list(vis_dir.glob("*.jpg"))) if vis_dir.exists() else 0
     
     print(f"   📊 帧: {frame_count} | 标注: {ann_count} | 可视化: {vis_count}")
     
     # 生成总结报告
     print(f"   📝 生成标注总结文档...")
-    stats = generate_summary(annotations_dir, video_name, frame_count)
+    stats = generate_summary(annotations_dir, video_name, frame_count, anns)
     stats["processing_time"] = elapsed_time  # 记录处理时间
     summary_md = create_summary_markdown(stats, video_name, fps, elapsed_time)
     
@@ -761,8 +839,7 @@ def finalize_dataset(video_name: str, video_path: str, dataset_dir: Path, fps: i
         "processing_time": elapsed_time
     }
     stats_path = dataset_dir / "stats.json"
-    with open(stats_path, "w", encoding="utf-8") as f:
-        json.dump(stats_json, f, ensure_ascii=False, indent=2)
+    write_json(stats_path, stats_json)
     print(f"   ✅ 生成 stats.json")
     
     return dataset_dir
@@ -824,15 +901,19 @@ async def main_async():
     if not annotations_dir:
         return
     
+    # 标注文件只列一次，可视化与报告共用
+    ann_files = sorted(annotations_dir.glob("*.json"))
+    
     # Step 3: 可视化（直接到 dataset/visualized）
     if args.skip_visualize:
         print(f"\n⏭️ 跳过可视化")
     else:
-        generate_visualizations(frames_dir, annotations_dir, dataset_dir)
+        generate_visualizations(frames_dir, annotations_dir, dataset_dir, json_paths=ann_files)
     
     # Step 4: 生成报告
     total_time = time.time() - start_time
-    finalize_dataset(output_name, str(video_path), dataset_dir, fps=args.fps, elapsed_time=total_time)
+    finalize_dataset(output_name, str(video_path), dataset_dir, fps=args.fps, elapsed_time=total_time,
+                     ann_files=ann_files)
     
     print("\n" + "=" * 70)
     print(f"🎉 完成！总耗时: {total_time/60:.1f} 分钟 ({total_time:.1f}秒)")
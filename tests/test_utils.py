@@ -13,8 +13,10 @@ from glm_labeling.utils import (
     normalize_vehicle_label,
     normalize_label,
     convert_normalized_coords,
+    find_images,
     get_category_emoji
 )
+from glm_labeling.utils.retry import _is_rate_limit_error
 
 
 class TestJsonUtils:
@@ -138,6 +140,45 @@ class TestImageUtils:
         bbox = [0, 0, 0, 0]
         result = convert_normalized_coords(bbox, 1920, 1080, base=1000)
         assert result == [0, 0, 0, 0]
+    
+    def test_find_images_matches_prefix_patterns(self, tmp_path):
+        """测试按前缀查找图片（与多 glob 并集一致）"""
+        for name in [
+            "D1_0001.jpg", "D1_0002.png", "D1.100f_0001.jpg",
+            "D1x.png", "D2_0001.jpg", "D1_notes.txt",
+        ]:
+            (tmp_path / name).touch()
+        
+        result = [p.name for p in find_images(tmp_path, "D1")]
+        assert result == ["D1.100f_0001.jpg", "D1_0001.jpg", "D1_0002.png"]
+    
+    def test_find_images_missing_dir(self, tmp_path):
+        """测试目录不存在时返回空列表"""
+        assert find_images(tmp_path / "missing", "D1") == []
+
+
+class TestRetryUtils:
+    """重试工具测试"""
+    
+    def test_rate_limit_from_status_code(self):
+        """测试通过状态码属性识别限流"""
+        error = Exception("boom")
+        error.status_code = 429
+        assert _is_rate_limit_error(error)
+    
+    def test_rate_limit_from_response(self):
+        """测试通过 response.status_code 识别限流"""
+        class Response:
+            status_code = 429
+        
+        error = Exception("boom")
+        error.response = Response()
+        assert _is_rate_limit_error(error)
+    
+    def test_rate_limit_from_message(self):
+        """测试通过错误信息识别限流"""
+        assert _is_rate_limit_error(Exception("Too Many Requests"))
+        assert not _is_rate_limit_error(Exception("connection reset"))
 
 
 if __name__ == "__main__":